@@ -0,0 +1,209 @@
+"""Headless batch import of MDL2 files, run with:
+blender --background --python batch_import.py -- <folders, files or globs> [options]
+Run with -- --help for a list of options."""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+
+# name under which the add-on package is imported when this file is run as a script
+PACKAGE_NAME = "cobra_tools"
+
+
+def find_files(inputs, recursive=False):
+	"""Returns a sorted list of the mdl2 files in the given folders, files or glob patterns"""
+	files = set()
+	for path in inputs:
+		if os.path.isdir(path):
+			pattern = os.path.join(path, "**", "*") if recursive else os.path.join(path, "*")
+			found = glob.glob(pattern, recursive=recursive)
+		else:
+			found = glob.glob(path, recursive=recursive)
+		files.update(os.path.abspath(p) for p in found if p.lower().endswith(".mdl2") and os.path.isfile(p))
+	return sorted(files)
+
+
+def get_root(files):
+	"""Returns the deepest folder that contains all files, or an empty string if they are on different drives"""
+	try:
+		return os.path.commonpath([os.path.dirname(file_path) for file_path in files])
+	except ValueError:
+		return ""
+
+
+def get_out_path(file_path, out_dir, root):
+	"""Returns the .blend path for a file, which mirrors its path relative to root under out_dir,
+	so that files of the same name in different folders do not overwrite each other"""
+	try:
+		rel_path = os.path.relpath(file_path, root) if root else ""
+	except ValueError:
+		rel_path = ""
+	if not rel_path or rel_path.startswith(os.pardir):
+		# outside of root, so mirror the full path with the drive as the first folder
+		drive, rel_path = os.path.splitdrive(file_path)
+		rel_path = os.path.join(drive.strip(":\\/"), rel_path.lstrip("\\/"))
+	return os.path.join(out_dir, os.path.splitext(rel_path)[0] + ".blend")
+
+
+def unlink_armatures(armatures, keep=()):
+	"""Unlinks cached armatures from the scene, so they are not saved into the .blend of other files"""
+	import bpy
+	scene_objects = bpy.context.scene.collection.objects
+	for ob in armatures:
+		if ob not in keep and ob.name in scene_objects:
+			scene_objects.unlink(ob)
+
+
+def get_used_armatures(new_objects):
+	"""Returns the armatures that the objects of one model are parented or deformed by"""
+	used = set()
+	for ob in new_objects:
+		if ob.type == "ARMATURE":
+			used.add(ob)
+		if ob.parent:
+			used.add(ob.parent)
+		used.update(mod.object for mod in ob.modifiers if mod.type == "ARMATURE" and mod.object)
+	return used
+
+
+def clear_imported(new_objects, armatures):
+	"""Removes the objects of one model from the scene, but keeps cached armatures around for reuse"""
+	import bpy
+	# reused armatures are linked again by the import, so they are not among the new objects
+	unlink_armatures(armatures)
+	for ob in new_objects:
+		if ob in armatures:
+			continue
+		me = ob.data if ob.type == "MESH" else None
+		bpy.data.objects.remove(ob, do_unlink=True)
+		if me and not me.users:
+			bpy.data.meshes.remove(me)
+
+
+def write_summary(summary_path, summary):
+	with open(summary_path, "w") as f:
+		json.dump(summary, f, indent="\t")
+
+
+def batch_import(files, out_dir, combined_path="", summary_path="", root=None, **load_kwargs):
+	"""Imports all files with a shared armature and material cache.
+	Writes a .blend per file into out_dir, in the folder structure of the files below root, or all into combined_path if given.
+	The summary is rewritten after every file, so it is available even if the run is killed."""
+	import bpy
+	from . import import_mdl2
+
+	start_time = time.time()
+	os.makedirs(out_dir, exist_ok=True)
+	if not summary_path:
+		summary_path = os.path.join(out_dir, "batch_summary.json")
+	if root is None:
+		root = get_root(files)
+	armature_cache = {}
+	material_cache = {}
+	summary = {"files": [], "succeeded": 0, "failed": 0, "seconds": 0.0}
+	for file_path in files:
+		file_start = time.time()
+		out_path = combined_path if combined_path else get_out_path(file_path, out_dir, root)
+		entry = {"file": file_path, "output": out_path, "errors": []}
+		old_objects = set(bpy.data.objects)
+		try:
+			entry["errors"] = list(import_mdl2.load(
+				None, bpy.context, filepath=file_path, armature_cache=armature_cache, material_cache=material_cache,
+				**load_kwargs))
+			if not combined_path:
+				# the rigs of earlier files stay in the cache, but must not end up in this file
+				unlink_armatures(armature_cache.values(), keep=get_used_armatures(set(bpy.data.objects) - old_objects))
+				os.makedirs(os.path.dirname(out_path), exist_ok=True)
+				bpy.ops.wm.save_as_mainfile(filepath=out_path, copy=True)
+			entry["status"] = "ok"
+			summary["succeeded"] += 1
+		except Exception as err:
+			traceback.print_exc()
+			entry["status"] = "failed"
+			entry["errors"].append(f"{type(err).__name__}: {err}")
+			summary["failed"] += 1
+		if not combined_path:
+			clear_imported(set(bpy.data.objects) - old_objects, set(armature_cache.values()))
+		entry["seconds"] = time.time() - file_start
+		summary["files"].append(entry)
+		summary["seconds"] = time.time() - start_time
+		write_summary(summary_path, summary)
+		print(f"[{len(summary['files'])}/{len(files)}] {entry['status']} {file_path} in {entry['seconds']:.2f} seconds")
+
+	if combined_path:
+		bpy.ops.wm.save_as_mainfile(filepath=combined_path)
+		summary["seconds"] = time.time() - start_time
+		write_summary(summary_path, summary)
+	print(f"Finished batch import of {len(files)} files in {summary['seconds']:.2f} seconds, {summary['failed']} failed")
+	return summary
+
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(prog="blender --background --python batch_import.py --", description=__doc__)
+	parser.add_argument("inputs", nargs="*", help="mdl2 files, folders or glob patterns")
+	parser.add_argument("-f", "--files-from", default="", help="text file listing one mdl2 file per line")
+	parser.add_argument("-o", "--out-dir", default="", help="folder for the .blend files and summary, defaults to the current folder")
+	parser.add_argument("-c", "--combined", default="", help="import everything into this one .blend file instead")
+	parser.add_argument("-s", "--summary", default="", help="path of the json summary, defaults to batch_summary.json in the output folder")
+	parser.add_argument("-r", "--recursive", action="store_true", help="search folders recursively")
+	parser.add_argument("--root", help="folder whose structure is mirrored in the output folder, defaults to the common folder of all files")
+	parser.add_argument("--use-custom-normals", action="store_true", help="preserve the original shading of the MDL2")
+	parser.add_argument("--mirror-mesh", action="store_true", help="mirror models")
+	parser.add_argument("--no-tris-to-quads", dest="tris_to_quads", action="store_false")
+	parser.add_argument("--no-remove-doubles", dest="remove_doubles", action="store_false")
+	parser.add_argument("--no-uv-seams", dest="uv_seams", action="store_false")
+	parser.add_argument("--lods", type=int, nargs="+", help="only import these LOD indices, eg. --lods 0")
+	parser.add_argument("--models", type=int, nargs="+", help="only import these model indices")
+	parser.add_argument("--materials", nargs="+", help="only import models with these materials")
+	return parser.parse_args(argv)
+
+
+def main(argv):
+	from .utils import log
+	# the add-on is not registered in this session, so its console output has to be set up here
+	log.setup()
+	args = parse_args(argv)
+	files = find_files(args.inputs, args.recursive)
+	if args.files_from:
+		with open(args.files_from) as f:
+			files.extend(os.path.abspath(line.strip()) for line in f if line.strip())
+	# a file that is listed twice would only overwrite its own output
+	files = list(dict.fromkeys(files))
+	if not files:
+		print("No mdl2 files found!")
+		return 1
+	summary = batch_import(
+		files, os.path.abspath(args.out_dir), combined_path=args.combined, summary_path=args.summary, root=args.root,
+		use_custom_normals=args.use_custom_normals, mirror_mesh=args.mirror_mesh, tris_to_quads=args.tris_to_quads,
+		remove_doubles=args.remove_doubles, uv_seams=args.uv_seams,
+		lods=args.lods, models=args.models, materials=args.materials)
+	return 1 if summary["failed"] else 0
+
+
+def script_args():
+	"""Returns the arguments that were passed to the script after '--'"""
+	if "--" in sys.argv:
+		return sys.argv[sys.argv.index("--")+1:]
+	return []
+
+
+def import_addon(module_name="batch_import"):
+	"""Imports the add-on as a package from its folder, so that relative imports work when run as a script.
+	Returns the given module of the add-on."""
+	import importlib
+	import importlib.util
+	addon_dir = os.path.dirname(os.path.abspath(__file__))
+	if PACKAGE_NAME not in sys.modules:
+		spec = importlib.util.spec_from_file_location(
+			PACKAGE_NAME, os.path.join(addon_dir, "__init__.py"), submodule_search_locations=[addon_dir])
+		package = importlib.util.module_from_spec(spec)
+		sys.modules[PACKAGE_NAME] = package
+		spec.loader.exec_module(package)
+	return importlib.import_module(f"{PACKAGE_NAME}.{module_name}")
+
+
+if __name__ == "__main__":
+	sys.exit(import_addon().main(script_args()))
@@ -0,0 +1,155 @@
+"""Parallel MDL2 to .blend conversion with a pool of headless blender workers, run with:
+python batch_pool.py <folders, files or globs> -o <output folder> [-j workers] [options]
+Import options that are not listed here (eg. --use-custom-normals) are passed on to batch_import.py."""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from batch_import import find_files, get_root
+
+BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_import.py")
+
+
+def read_summary(summary_path):
+	"""Returns the entries a worker has finished so far, or none if it did not get to write a summary"""
+	try:
+		with open(summary_path) as f:
+			return json.load(f)["files"]
+	except (OSError, ValueError, KeyError):
+		return []
+
+
+def run_shard(shard_id, files, blender, work_dir, out_dir, root, file_timeout, import_args):
+	"""Converts a list of files in one blender process.
+	The worker is killed if it does not finish a file within file_timeout seconds.
+	Returns the summary entries of the finished files and the status of the process."""
+	base = os.path.join(work_dir, f"shard_{shard_id}")
+	list_path = base + ".txt"
+	summary_path = base + ".json"
+	log_path = base + ".log"
+	with open(list_path, "w") as f:
+		f.write("\n".join(files))
+	if os.path.isfile(summary_path):
+		os.remove(summary_path)
+	cmd = [
+		blender, "--background", "--factory-startup", "--python-exit-code", "2", "--python", BATCH_SCRIPT, "--",
+		"--files-from", list_path, "--out-dir", out_dir, "--root", root, "--summary", summary_path, *import_args]
+	with open(log_path, "w") as log:
+		proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+		num_done = 0
+		last_progress = time.time()
+		status = "finished"
+		while proc.poll() is None:
+			time.sleep(0.5)
+			done = len(read_summary(summary_path))
+			if done != num_done:
+				num_done = done
+				last_progress = time.time()
+			elif time.time() - last_progress > file_timeout:
+				proc.kill()
+				proc.wait()
+				status = "timeout"
+				break
+		else:
+			if proc.returncode not in (0, 1):
+				status = "crashed"
+	return read_summary(summary_path), status, log_path
+
+
+def batch_pool(files, blender, out_dir, jobs=None, chunk_size=10, file_timeout=600.0, retries=1, import_args=()):
+	"""Shards files across blender workers, retries failed files on their own and returns a consolidated report"""
+	start_time = time.time()
+	jobs = jobs or os.cpu_count() or 1
+	work_dir = os.path.join(out_dir, "batch_pool")
+	# all workers mirror the folders below the same root, no matter which files they get
+	root = get_root(files)
+	os.makedirs(work_dir, exist_ok=True)
+	results = {}
+	attempts = dict((file_path, 0) for file_path in files)
+	queue = [files[i:i+chunk_size] for i in range(0, len(files), chunk_size)]
+	shard_count = 0
+	with ThreadPoolExecutor(max_workers=jobs) as pool:
+		running = {}
+		while queue or running:
+			# keep all workers busy
+			while queue and len(running) < jobs:
+				shard = queue.pop(0)
+				future = pool.submit(run_shard, shard_count, shard, blender, work_dir, out_dir, root, file_timeout, import_args)
+				running[future] = shard
+				shard_count += 1
+			done, _ = wait(running, return_when=FIRST_COMPLETED)
+			for future in done:
+				shard = running.pop(future)
+				entries, status, log_path = future.result()
+				finished = set()
+				for entry in entries:
+					file_path = entry["file"]
+					finished.add(file_path)
+					attempts[file_path] += 1
+					entry["attempts"] = attempts[file_path]
+					entry["log"] = log_path
+					results[file_path] = entry
+					if entry["status"] != "ok" and attempts[file_path] <= retries:
+						queue.append([file_path])
+				missing = [file_path for file_path in shard if file_path not in finished]
+				if missing:
+					if status == "finished":
+						status = "crashed"
+					# the first missing file is the one the worker was busy with when it died
+					culprit = missing[0]
+					attempts[culprit] += 1
+					results[culprit] = {
+						"file": culprit, "status": status, "attempts": attempts[culprit], "log": log_path,
+						"errors": [f"Worker {status} while importing this file"], "seconds": None}
+					if attempts[culprit] <= retries:
+						queue.append([culprit])
+					# the remaining files never got a chance, so they don't count as an attempt
+					if missing[1:]:
+						queue.append(missing[1:])
+				print(f"Shard of {len(shard)} files {status}, {len(results)}/{len(files)} files processed")
+
+	report = {
+		"files": [results[file_path] for file_path in files],
+		"succeeded": sum(1 for entry in results.values() if entry["status"] == "ok"),
+		"failed": sum(1 for entry in results.values() if entry["status"] != "ok"),
+		"workers": jobs,
+		"shards": shard_count,
+		"seconds": time.time() - start_time}
+	report_path = os.path.join(out_dir, "batch_report.json")
+	with open(report_path, "w") as f:
+		json.dump(report, f, indent="\t")
+	print(f"Converted {len(files)} files in {report['seconds']:.2f} seconds, {report['failed']} failed, see {report_path}")
+	return report
+
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(prog="python batch_pool.py", description=__doc__)
+	parser.add_argument("inputs", nargs="+", help="mdl2 files, folders or glob patterns")
+	parser.add_argument("-o", "--out-dir", default="", help="folder for the .blend files and report, defaults to the current folder")
+	parser.add_argument("-r", "--recursive", action="store_true", help="search folders recursively")
+	parser.add_argument("-j", "--jobs", type=int, default=0, help="number of blender workers, defaults to the cpu count")
+	parser.add_argument("-b", "--blender", default=os.environ.get("BLENDER", "blender"), help="path of the blender executable")
+	parser.add_argument("--chunk-size", type=int, default=10, help="files per worker process")
+	parser.add_argument("--timeout", type=float, default=600.0, help="seconds a worker may spend on a single file")
+	parser.add_argument("--retries", type=int, default=1, help="how often a failed file is retried on its own")
+	return parser.parse_known_args(argv)
+
+
+def main(argv):
+	args, import_args = parse_args(argv)
+	files = find_files(args.inputs, args.recursive)
+	if not files:
+		print("No mdl2 files found!")
+		return 1
+	report = batch_pool(
+		files, args.blender, os.path.abspath(args.out_dir), jobs=args.jobs, chunk_size=max(1, args.chunk_size),
+		file_timeout=args.timeout, retries=args.retries, import_args=import_args)
+	return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,311 @@
+"""Benchmarks the import, export, bani, shell and fin pipelines on synthetic data of configurable size and on a real mdl2, run with:
+blender --background --factory-startup --python benchmark.py -- [options]
+The results are written as json and can be compared against the json of an earlier run with --baseline.
+Run with -- --help for a list of options."""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+# flags of the models that get shells, and of the fins built from them
+SHELL_FLAG = 885
+FIN_FLAG = 565
+# differences below this many seconds are never reported as regressions, they are mostly noise
+MIN_DIFFERENCE = 0.005
+
+
+def make_grid(num_verts):
+	"""Returns the positions and tris of a square grid with at least num_verts vertices"""
+	side = max(2, int(np.ceil(np.sqrt(num_verts))))
+	x, y = np.meshgrid(np.linspace(-1.0, 1.0, side), np.linspace(-1.0, 1.0, side))
+	positions = np.stack((x.ravel(), y.ravel(), np.zeros(side * side)), axis=-1)
+	corners = (np.arange(side - 1)[:, None] * side + np.arange(side - 1)).ravel()
+	tris = np.concatenate((
+		np.stack((corners, corners + 1, corners + side + 1), axis=-1),
+		np.stack((corners, corners + side + 1, corners + side), axis=-1)))
+	return positions, tris
+
+
+def make_bone_names(num_bones):
+	"""Returns ms2 bone names, mixing center and side bones like a real rig"""
+	prefixes = ("def_c_", "def_l_", "def_r_")
+	return [f"{prefixes[i % 3]}bone{i}_joint" for i in range(num_bones)]
+
+
+def make_model_data(num_verts, num_uvs, bone_names, seed=0):
+	"""Returns mdl2 data with a single rigged grid model, shaped like what import_mdl2 reads from a file"""
+	rng = np.random.default_rng(seed)
+	positions, tris = make_grid(num_verts)
+	num_verts = len(positions)
+	# every vertex is weighted to two neighbouring bones
+	bone_a = rng.integers(0, len(bone_names), num_verts)
+	bone_b = (bone_a + 1) % len(bone_names)
+	weight_a = rng.uniform(0.5, 1.0, num_verts).round(3)
+	weights = [
+		[(bone_names[a], wa), (bone_names[b], 1.0 - wa)] for a, b, wa in zip(bone_a.tolist(), bone_b.tolist(), weight_a.tolist())]
+	normals = np.zeros((num_verts, 3))
+	normals[:, 2] = 1.0
+	model = SimpleNamespace(
+		vertices=positions.tolist(), tris=tris.tolist(), uvs=rng.uniform(0.0, 1.0, (num_verts, num_uvs, 2)),
+		colors=None, weights=weights, normals=normals, flag=0, lod_index=0, material="benchmark")
+	return SimpleNamespace(bone_info=None, mdl2_header=SimpleNamespace(models=[model]))
+
+
+def make_bani_data(num_bones, num_frames, seed=0):
+	"""Returns bani data with random eulers in degrees for each frame and bone"""
+	rng = np.random.default_rng(seed)
+	data_0 = SimpleNamespace(animation_length=num_frames / 30.0, num_frames=num_frames)
+	return SimpleNamespace(header=SimpleNamespace(data_0=data_0), eulers=rng.uniform(-45.0, 45.0, (num_frames, num_bones, 3)))
+
+
+def make_armature(bone_names):
+	"""Creates an armature whose bones form a binary tree, in the given order"""
+	import bpy
+	from .utils import matrix_util
+	b_armature_data = bpy.data.armatures.new("benchmark_armature")
+	b_armature_obj = bpy.data.objects.new("benchmark_armature", b_armature_data)
+	bpy.context.scene.collection.objects.link(b_armature_obj)
+	bpy.context.view_layer.objects.active = b_armature_obj
+	bpy.ops.object.mode_set(mode="EDIT")
+	edit_bones = []
+	for i, bone_name in enumerate(bone_names):
+		b_edit_bone = b_armature_data.edit_bones.new(matrix_util.bone_name_for_blender(bone_name))
+		b_edit_bone.head = (0.0, 0.0, 0.1 * i)
+		b_edit_bone.tail = (0.0, 0.05, 0.1 * i)
+		if i:
+			b_edit_bone.parent = edit_bones[(i - 1) // 2]
+		edit_bones.append(b_edit_bone)
+	bpy.ops.object.mode_set(mode="OBJECT")
+	# store the ms2 order like import_armature does
+	for i, bone_name in enumerate(bone_names):
+		b_armature_obj.pose.bones[matrix_util.bone_name_for_blender(bone_name)]["index"] = i
+	return b_armature_obj
+
+
+def import_model(data):
+	"""Imports the synthetic mdl2 data and returns the new mesh object"""
+	import bpy
+	from . import import_mdl2
+	old_objects = set(bpy.data.objects)
+	import_mdl2.load(
+		None, bpy.context, filepath="benchmark.mdl2", tris_to_quads=False, remove_doubles=False, uv_seams=False, data=data)
+	return next(ob for ob in bpy.data.objects if ob not in old_objects and ob.type == "MESH")
+
+
+def add_fur_length(ob, seed=0):
+	"""Adds a random fur_length vertex group, as used by shells and fins"""
+	rng = np.random.default_rng(seed)
+	vgroup = ob.vertex_groups.new(name="fur_length")
+	for i, weight in enumerate(rng.uniform(0.0, 1.0, len(ob.data.vertices)).round(2).tolist()):
+		vgroup.add([i], weight, "REPLACE")
+
+
+def reset():
+	"""Starts every run from an empty scene and empty caches"""
+	import bpy
+	from .utils import format_cache, texture_index, skeleton
+	from . import export_mdl2
+	bpy.ops.wm.read_factory_settings(use_empty=True)
+	format_cache.cache.clear()
+	texture_index.clear()
+	skeleton.clear()
+	export_mdl2.export_cache.clear()
+
+
+def bench_import(args):
+	data = make_model_data(args.verts, args.uv_layers, make_bone_names(args.bones))
+	yield
+	import_model(data)
+
+
+def bench_export_split(args):
+	"""Extraction and vertex splitting of the export, without the mdl2 file around it"""
+	import bpy
+	from . import export_mdl2
+	from .cobra_core import split
+	from .utils import skeleton
+	bone_names = make_bone_names(args.bones)
+	bones_table = skeleton.get_skeleton(make_armature(bone_names)).index
+	ob = import_model(make_model_data(args.verts, args.uv_layers, bone_names))
+	yield
+	export_mdl2.ensure_tri_modifier(ob)
+	dg = bpy.context.evaluated_depsgraph_get()
+	eval_obj = ob.evaluated_get(dg)
+	me = eval_obj.to_mesh(preserve_all_data_layers=True, depsgraph=dg)
+	arrays = export_mdl2.extract_arrays(ob, me, bones_table, use_fur_length=False)
+	eval_obj.to_mesh_clear()
+	split.split_model(arrays)
+
+
+def bench_export(args):
+	"""Exports a real mdl2 that was imported beforehand, with copies of it and its ms2 in a temp folder"""
+	import bpy
+	from . import import_mdl2, export_mdl2
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		ms2_path = import_mdl2.get_ms2_path(import_mdl2.read_mdl2(args.mdl2), args.mdl2)
+		for file_path in (args.mdl2, ms2_path):
+			shutil.copy2(file_path, tmp_dir)
+		filepath = os.path.join(tmp_dir, os.path.basename(args.mdl2))
+		import_mdl2.load(None, bpy.context, filepath=filepath)
+		yield
+		errors = export_mdl2.save(None, bpy.context, filepath=filepath, incremental=False)
+		if errors:
+			raise RuntimeError("\n".join(errors))
+		# removing the temp folder is not timed
+		yield
+
+
+def bench_round_trip(args):
+	"""Imports a real mdl2 and exports it again, the export goes into the export subfolder next to it"""
+	import bpy
+	from . import import_mdl2, export_mdl2
+	yield
+	import_mdl2.load(None, bpy.context, filepath=args.mdl2)
+	errors = export_mdl2.save(None, bpy.context, filepath=args.mdl2, incremental=False)
+	if errors:
+		raise RuntimeError("\n".join(errors))
+
+
+def bench_bani(args):
+	from . import import_bani
+	b_armature_obj = make_armature(make_bone_names(args.bones))
+	data = make_bani_data(args.bones, args.frames)
+	yield
+	import_bani.import_clip(b_armature_obj, import_bani.get_rig(b_armature_obj), data, "benchmark")
+
+
+def bench_strip_shells(args):
+	from .utils import shell
+	data = make_model_data(args.verts, args.uv_layers, make_bone_names(args.bones))
+	model = data.mdl2_header.models[0]
+	# the faces of the base mesh are repeated for each shell
+	model.tris = model.tris * args.shells
+	ob = import_model(data)
+	yield
+	shell.strip_shells(ob, args.shells)
+
+
+def bench_build_fins(args):
+	import bpy
+	from .utils import shell, matrix_util
+	data = make_model_data(args.verts, max(2, args.uv_layers), make_bone_names(args.bones))
+	src_ob = import_model(data)
+	src_ob["flag"] = SHELL_FLAG
+	add_fur_length(src_ob)
+	trg_ob = import_model(make_model_data(4, 1, make_bone_names(1)))
+	trg_ob["flag"] = FIN_FLAG
+	for ob in (src_ob, trg_ob):
+		bpy.context.scene.collection.objects.unlink(ob)
+		matrix_util.LOD(ob, 0)
+	yield
+	shell.build_fins(src_ob, trg_ob)
+
+
+# name -> generator function, which sets up a run, yields, and then runs the timed part, up to an optional second yield
+BENCHMARKS = {
+	"import": bench_import,
+	"export split": bench_export_split,
+	"export": bench_export,
+	"round trip": bench_round_trip,
+	"bani": bench_bani,
+	"strip shells": bench_strip_shells,
+	"build fins": bench_build_fins,
+}
+
+
+def run_benchmark(func, args):
+	"""Returns the seconds of each run of a benchmark, every run is set up from scratch"""
+	runs = []
+	for i in range(args.repeat):
+		reset()
+		steps = func(args)
+		next(steps)
+		start_time = time.perf_counter()
+		next(steps, None)
+		runs.append(time.perf_counter() - start_time)
+		# clean up after the timed part
+		for _ in steps:
+			pass
+	return runs
+
+
+def compare(results, baseline, threshold=0.2):
+	"""Prints a table of the results against the baseline and returns the names of the benchmarks that regressed"""
+	regressed = []
+	width = max(len(name) for name in results["benchmarks"])
+	print(f"{'benchmark':<{width}}  {'baseline':>9}  {'current':>9}  {'ratio':>6}")
+	for name, result in results["benchmarks"].items():
+		base = baseline["benchmarks"].get(name)
+		if not base:
+			print(f"{name:<{width}}  {'-':>9}  {result['seconds']:>9.3f}")
+			continue
+		ratio = result["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+		is_slower = ratio > 1.0 + threshold and result["seconds"] - base["seconds"] > MIN_DIFFERENCE
+		if is_slower:
+			regressed.append(name)
+		print(f"{name:<{width}}  {base['seconds']:>9.3f}  {result['seconds']:>9.3f}  {ratio:>6.2f}{'  REGRESSED' if is_slower else ''}")
+	if results["config"] != baseline.get("config"):
+		print("Warning: the baseline was run with different settings")
+	return regressed
+
+
+def parse_args(argv):
+	parser = argparse.ArgumentParser(prog="blender --background --factory-startup --python benchmark.py --", description=__doc__)
+	parser.add_argument("--verts", type=int, default=10000, help="vertices of the synthetic meshes")
+	parser.add_argument("--uv-layers", type=int, default=2, help="uv layers of the synthetic meshes")
+	parser.add_argument("--bones", type=int, default=100, help="bones of the synthetic armature")
+	parser.add_argument("--frames", type=int, default=300, help="frames of the synthetic animation")
+	parser.add_argument("--shells", type=int, default=6, help="shell count of the mesh for strip shells")
+	parser.add_argument("--mdl2", default="", help="also time importing and exporting this mdl2 file")
+	parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="only run these benchmarks")
+	parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per benchmark, the fastest one counts")
+	parser.add_argument("-o", "--output", default="benchmark.json", help="path of the json results")
+	parser.add_argument("-b", "--baseline", default="", help="json results of an earlier run to compare against")
+	parser.add_argument("-t", "--threshold", type=float, default=0.2, help="allowed slowdown against the baseline, eg. 0.2 for 20%%")
+	return parser.parse_args(argv)
+
+
+def main(argv):
+	import bpy
+	from .utils import log
+	log.setup("WARNING")
+	args = parse_args(argv)
+	names = args.only or list(BENCHMARKS)
+	if not args.mdl2:
+		names = [name for name in names if name not in ("export", "round trip")]
+	results = {
+		"config": {
+			"verts": args.verts, "uv_layers": args.uv_layers, "bones": args.bones, "frames": args.frames,
+			"shells": args.shells, "mdl2": os.path.basename(args.mdl2), "repeat": args.repeat},
+		"blender": bpy.app.version_string,
+		"benchmarks": {},
+	}
+	for name in names:
+		runs = run_benchmark(BENCHMARKS[name], args)
+		results["benchmarks"][name] = {"seconds": min(runs), "runs": runs}
+		print(f"{name}: {min(runs):.3f} seconds (best of {len(runs)})")
+	with open(args.output, "w") as f:
+		json.dump(results, f, indent="\t")
+	print(f"Wrote benchmark results to {os.path.abspath(args.output)}")
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressed = compare(results, baseline, args.threshold)
+		if regressed:
+			print(f"{len(regressed)} benchmarks regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+			return 1
+	return 0
+
+
+if __name__ == "__main__":
+	# the add-on folder is not on the path when blender runs this file as a script
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	import batch_import
+	sys.exit(batch_import.import_addon("benchmark").main(batch_import.script_args()))
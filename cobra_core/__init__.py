@@ -0,0 +1,2 @@
+"""Geometry processing for the Cobra formats that works on plain numpy arrays and does not need bpy.
+split_worker.py imports it as a top level package in worker processes, which only have the add-on folder on their path."""
@@ -0,0 +1,84 @@
+import numpy as np
+
+from .pose import topological_order
+
+AXES = {"X": 0, "Y": 1, "Z": 2}
+
+
+def axis_matrix(forward, up):
+	"""Returns the 4x4 matrix that converts from the given forward and up axes to blender's Y forward and Z up,
+	like bpy_extras.io_utils.axis_conversion(forward, up).to_4x4()"""
+	basis = np.zeros((2, 3), dtype=np.float64)
+	for row, axis in zip(basis, (forward, up)):
+		row[AXES[axis[-1]]] = -1.0 if axis.startswith("-") else 1.0
+	if basis[0] @ basis[1]:
+		raise ValueError(f"Forward axis {forward} and up axis {up} must be perpendicular")
+	# the rows map the source right, forward and up axes onto X, Y and Z
+	matrix = np.eye(4, dtype=np.float64)
+	matrix[:3, :3] = (np.cross(basis[0], basis[1]), basis[0], basis[1])
+	return matrix
+
+
+# ms2 armature space to blender armature space
+CORRECTION_GLOB = axis_matrix("-Z", "Y")
+CORRECTION_GLOB_INV = np.linalg.inv(CORRECTION_GLOB)
+# mirror about x axis too
+XFLIP = np.diag((-1.0, 1.0, 1.0, 1.0))
+# orientation of the bones' local axes
+CORRECTION = axis_matrix("-X", "Y")
+
+
+def nif_bind_to_blender_bind(matrices, correction=CORRECTION):
+	"""Converts ms2 armature space matrices, shaped (..., 4, 4), to blender armature space"""
+	# post multiplication: local space
+	return XFLIP @ CORRECTION_GLOB @ matrices @ np.linalg.inv(correction)
+
+
+def xflipper(matrices):
+	return matrices @ XFLIP
+
+
+def blender_bind_to_nif_bind(matrices, correction=CORRECTION):
+	"""Converts blender armature space matrices, shaped (..., 4, 4), to ms2 armature space"""
+	return CORRECTION_GLOB_INV @ XFLIP @ matrices @ XFLIP @ correction
+
+
+def quaternion_to_matrix(quats, locations=None):
+	"""Returns 4x4 matrices for wxyz quaternions, shaped (..., 4), like mathutils.Quaternion.to_matrix().to_4x4().
+	The quaternions are not normalized, and the matrices get the locations as translation if given."""
+	w, x, y, z = np.moveaxis(np.asarray(quats, dtype=np.float64), -1, 0)
+	mats = np.zeros(w.shape + (4, 4), dtype=np.float64)
+	mats[..., 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+	mats[..., 0, 1] = 2.0 * (x * y - w * z)
+	mats[..., 0, 2] = 2.0 * (x * z + w * y)
+	mats[..., 1, 0] = 2.0 * (x * y + w * z)
+	mats[..., 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+	mats[..., 1, 2] = 2.0 * (y * z - w * x)
+	mats[..., 2, 0] = 2.0 * (x * z - w * y)
+	mats[..., 2, 1] = 2.0 * (y * z + w * x)
+	mats[..., 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+	mats[..., 3, 3] = 1.0
+	if locations is not None:
+		mats[..., :3, 3] = locations
+	return mats
+
+
+def to_armature_space(local_matrices, parent_indices):
+	"""Chains the matrices of the bones relative to their parent, shaped (bones, 4, 4), into armature space.
+	parent_indices has the index of each bone's parent, or -1 for roots."""
+	matrices = np.array(local_matrices, dtype=np.float64)
+	for bone_i in topological_order(parent_indices):
+		parent_i = parent_indices[bone_i]
+		if parent_i >= 0:
+			matrices[bone_i] = matrices[parent_i] @ matrices[bone_i]
+	return matrices
+
+
+def to_local_space(armature_matrices, parent_indices):
+	"""Returns the matrices of the bones relative to their parent, the inverse of to_armature_space"""
+	armature_matrices = np.asarray(armature_matrices, dtype=np.float64)
+	local_matrices = armature_matrices.copy()
+	for bone_i, parent_i in enumerate(parent_indices):
+		if parent_i >= 0:
+			local_matrices[bone_i] = np.linalg.inv(armature_matrices[parent_i]) @ armature_matrices[bone_i]
+	return local_matrices
@@ -0,0 +1,35 @@
+import numpy as np
+
+
+def simplify(values, tolerance):
+	"""Returns the sorted indices of the keys of a baked curve that have to be kept,
+	so that linear interpolation between them stays within tolerance of all values"""
+	num_keys = len(values)
+	if num_keys < 3:
+		return np.arange(num_keys)
+	keep = np.zeros(num_keys, dtype=bool)
+	keep[[0, -1]] = True
+	# split segments at their worst key until all are close enough, like Ramer-Douglas-Peucker
+	segments = [(0, num_keys - 1)]
+	while segments:
+		start, end = segments.pop()
+		if end - start < 2:
+			continue
+		t = np.arange(1, end - start) / (end - start)
+		line = values[start] + t * (values[end] - values[start])
+		errors = np.abs(values[start + 1:end] - line)
+		worst = np.argmax(errors)
+		if errors[worst] > tolerance:
+			split = start + 1 + worst
+			keep[split] = True
+			segments.append((start, split))
+			segments.append((split, end))
+	return np.flatnonzero(keep)
+
+
+def reduce_channel(values, tolerance):
+	"""Returns the indices of the keys of a baked channel that have to be kept.
+	Constant channels keep a single key, so that other actions can not leave their pose on the bone."""
+	if np.ptp(values) <= tolerance:
+		return np.arange(1)
+	return simplify(values, tolerance)
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+def euler_to_matrix(eulers):
+	"""Converts XYZ eulers in radians, shaped (..., 3), to rotation matrices like mathutils.Euler.to_matrix()"""
+	x, y, z = np.moveaxis(eulers, -1, 0)
+	cx, cy, cz = np.cos(x), np.cos(y), np.cos(z)
+	sx, sy, sz = np.sin(x), np.sin(y), np.sin(z)
+	mats = np.empty(eulers.shape[:-1] + (3, 3), dtype=np.float64)
+	mats[..., 0, 0] = cy * cz
+	mats[..., 0, 1] = sx * sy * cz - cx * sz
+	mats[..., 0, 2] = cx * sy * cz + sx * sz
+	mats[..., 1, 0] = cy * sz
+	mats[..., 1, 1] = sx * sy * sz + cx * cz
+	mats[..., 1, 2] = cx * sy * sz - sx * cz
+	mats[..., 2, 0] = -sy
+	mats[..., 2, 1] = sx * cy
+	mats[..., 2, 2] = cx * cy
+	return mats
+
+
+def matrix_to_euler(mats):
+	"""Converts matrices, shaped (..., 3, 3), to XYZ eulers in radians.
+	Like blender, this picks the smaller of the two possible solutions."""
+	mats = mats / np.linalg.norm(mats, axis=-2, keepdims=True)
+	cy = np.hypot(mats[..., 0, 0], mats[..., 1, 0])
+	eul1 = np.stack((
+		np.arctan2(mats[..., 2, 1], mats[..., 2, 2]),
+		np.arctan2(-mats[..., 2, 0], cy),
+		np.arctan2(mats[..., 1, 0], mats[..., 0, 0])), axis=-1)
+	eul2 = np.stack((
+		np.arctan2(-mats[..., 2, 1], -mats[..., 2, 2]),
+		np.arctan2(-mats[..., 2, 0], -cy),
+		np.arctan2(-mats[..., 1, 0], -mats[..., 0, 0])), axis=-1)
+	# gimbal lock
+	locked = cy <= 16 * np.finfo(np.float32).eps
+	eul1[locked, 0] = np.arctan2(-mats[locked, 1, 2], mats[locked, 1, 1])
+	eul1[locked, 2] = 0.0
+	eul2[locked] = eul1[locked]
+	use_eul2 = np.abs(eul1).sum(axis=-1) > np.abs(eul2).sum(axis=-1)
+	return np.where(use_eul2[..., None], eul2, eul1)
+
+
+def topological_order(parent_indices):
+	"""Returns the bone indices ordered so that every parent comes before its children"""
+	children = [[] for _ in parent_indices]
+	roots = []
+	for bone_i, parent_i in enumerate(parent_indices):
+		if parent_i < 0:
+			roots.append(bone_i)
+		else:
+			children[parent_i].append(bone_i)
+	order = []
+	stack = list(reversed(roots))
+	while stack:
+		bone_i = stack.pop()
+		order.append(bone_i)
+		stack.extend(reversed(children[bone_i]))
+	if len(order) != len(parent_indices):
+		raise ValueError("The bone hierarchy has a cycle!")
+	return order
+
+
+def solve_pose(rest_matrices, parent_indices, eulers, corr_matrix, locations=None):
+	"""Solves the local pose channels of a bani for all bones and frames, without a blender scene.
+	rest_matrices are the armature space rest matrices of the bones (bone.matrix_local), shaped (bones, 4, 4).
+	parent_indices has the index of each bone's parent, or -1 for roots.
+	eulers are the bani rotations in radians, shaped (frames, bones, 3), which are applied globally to each bone.
+	corr_matrix rotates the bani space into blender space.
+	locations are the local locations the bones should keep, shaped (frames, bones, 3), zero if not given.
+	Returns the local rotation_euler and location of every bone for every frame, each shaped (frames, bones, 3)."""
+	num_frames, num_bones = eulers.shape[:2]
+	if locations is None:
+		locations = np.zeros((num_frames, num_bones, 3), dtype=np.float64)
+	rotations = euler_to_matrix(eulers)
+	# the armature space matrix of each posed bone
+	posed = np.zeros((num_frames, num_bones, 4, 4), dtype=np.float64)
+	posed[..., 3, 3] = 1.0
+	out_eulers = np.empty((num_frames, num_bones, 3), dtype=np.float64)
+	out_locations = np.empty((num_frames, num_bones, 3), dtype=np.float64)
+	for bone_i in topological_order(parent_indices):
+		rest = rest_matrices[bone_i]
+		parent_i = parent_indices[bone_i]
+		# the space the local channels of this bone live in, per frame
+		if parent_i < 0:
+			channel_space = np.broadcast_to(rest, (num_frames, 4, 4))
+		else:
+			channel_space = posed[:, parent_i] @ np.linalg.inv(rest_matrices[parent_i]) @ rest
+		# the posed head follows the parent chain, the rotation is set globally
+		posed[:, bone_i, :3, 3] = (channel_space[:, :3, :3] @ locations[:, bone_i, :, None])[..., 0] + channel_space[:, :3, 3]
+		posed[:, bone_i, :3, :3] = corr_matrix @ rotations[:, bone_i] @ rest[:3, :3]
+		basis = np.linalg.inv(channel_space) @ posed[:, bone_i]
+		out_eulers[:, bone_i] = matrix_to_euler(basis[:, :3, :3])
+		out_locations[:, bone_i] = basis[:, :3, 3]
+	return out_eulers, out_locations
@@ -0,0 +1,87 @@
+import numpy as np
+
+# fin uvs start at this x coordinate and span this many times the length of each fin
+FIN_U_START = -16.0
+FIN_U_SCALE = 6.0
+# v coordinate of the edge of the fins at the surface
+FIN_V_TOP = 1.00049
+# faces a fin ring grows by at most
+FIN_RING_STEPS = 10
+
+
+def base_count(num_tris, shell_count):
+	"""Returns how many of the tris or faces of a mesh with shells belong to the base mesh"""
+	return num_tris // shell_count
+
+
+def strip_tris(tris, shell_count):
+	"""Returns the tris of the base mesh, without the shells that repeat them"""
+	return tris[:base_count(len(tris), shell_count)]
+
+
+def replicate_tris(tris, shell_count):
+	"""Returns the tris of the base mesh, followed by a copy of them for each additional shell"""
+	return np.tile(np.asarray(tris, dtype=np.uint16), (shell_count + 1, 1))
+
+
+def get_face_edges(quads):
+	"""Returns the edge index of each side of the quads, shaped (faces, 4), and the faces of each edge.
+	Side i goes from corner i to corner i+1. The faces of each edge are in the order bmesh links them,
+	ie. the most recently created face first, then the others by index."""
+	sides = np.stack((quads, np.roll(quads, -1, axis=1)), axis=-1).reshape(-1, 2)
+	_, face_edges = np.unique(np.sort(sides, axis=1), axis=0, return_inverse=True)
+	face_edges = face_edges.reshape(-1, 4)
+	edge_faces = [[] for _ in range(face_edges.max() + 1)]
+	for face_i, edges in enumerate(face_edges.tolist()):
+		for edge_i in edges:
+			edge_faces[edge_i].append(face_i)
+	edge_faces = [faces[-1:] + faces[:-1] for faces in edge_faces]
+	return face_edges.tolist(), edge_faces
+
+
+def get_face_ring(face_i, face_edges, edge_faces, normals, tagged):
+	"""Returns a strip of faces starting at face_i, continuing at each step with the linked face whose orientation
+	is most similar. The faces that were stepped from are tagged so that other rings skip them."""
+	strip = [face_i, ]
+	for i in range(FIN_RING_STEPS):
+		current_face = strip[-1]
+		tagged[current_face] = True
+		link_faces = [f for e in face_edges[current_face] for f in edge_faces[e] if f not in strip and not tagged[f]]
+		if link_faces:
+			dots = np.abs(normals[link_faces] @ normals[current_face])
+			# of equally similar faces, take the last one
+			strip.append(link_faces[len(dots) - 1 - np.argmax(dots[::-1])])
+	return strip
+
+
+def fin_uvs(quads, positions, normals, uvs, fur_lengths, has_fur_length):
+	"""Generates the second uv layer of the fins, which maps each ring of fins onto a strip of the fur texture.
+	quads are the vertex indices of the corners of each fin, shaped (faces, 4), with the surface edge first.
+	normals are the face normals, uvs the current uvs of all corners, shaped (faces, 4, 2).
+	fur_lengths are the weights of the vertices in the fur_length group, if has_fur_length is set for them.
+	Returns the new uvs of all corners."""
+	quads = np.asarray(quads, dtype=np.int64)
+	positions = np.asarray(positions, dtype=np.float64)
+	normals = np.asarray(normals, dtype=np.float64)
+	uvs = np.array(uvs, dtype=np.float64)
+	if not len(quads):
+		return uvs
+	face_edges, edge_faces = get_face_edges(quads)
+	# the fin of the edge from the first to the second corner is that much wider in uv space
+	lengths = np.linalg.norm(positions[quads[:, 1]] - positions[quads[:, 0]], axis=1).astype(np.float32)
+	widths = (lengths.astype(np.float64) * FIN_U_SCALE).tolist()
+	# the top corners are at the surface, the lower ones at the tip of the fur
+	uvs[:, :2, 1] = FIN_V_TOP
+	lower_corners = quads[:, 2:]
+	uvs[:, 2:, 1] = np.where(has_fur_length[lower_corners], 1.0 - fur_lengths[lower_corners] * 2.0, uvs[:, 2:, 1])
+	tagged = np.zeros(len(quads), dtype=bool)
+	for face_i in range(len(quads)):
+		if not tagged[face_i]:
+			ring = get_face_ring(face_i, face_edges, edge_faces, normals, tagged)
+			# lay out the fins of the ring next to each other
+			x_0 = 0.0
+			for face in ring:
+				uvs[face, (0, 3), 0] = FIN_U_START + x_0
+				uvs[face, (1, 2), 0] = FIN_U_START + x_0 + widths[face]
+				x_0 += widths[face]
+	return uvs
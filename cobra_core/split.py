@@ -0,0 +1,144 @@
+import numpy as np
+
+# codes for vertex groups that do not map to a bone
+UNK0 = -2
+RESIDUE = -3
+FUR_LENGTH = -4
+EXTRANEOUS = -1
+
+
+def unique_rows(keys):
+	"""Deduplicates the rows of a 2D array by comparing their bytes.
+	Returns the indices of the unique rows in order of their first appearance,
+	and for every row the index of its unique row in that order."""
+	keys = np.ascontiguousarray(keys)
+	void_keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+	_, first, inverse = np.unique(void_keys, return_index=True, return_inverse=True)
+	# np.unique sorts the keys, so restore the order in which they were first encountered
+	order = np.argsort(first)
+	rank = np.empty_like(order)
+	rank[order] = np.arange(len(order))
+	return first[order], rank[inverse.ravel()]
+
+
+def weights_table(num_verts, entry_verts, entry_codes, entry_weights, use_fur_length=True):
+	"""Resolves the vertex group assignments of a mesh once per vertex.
+	entry_* describe each assignment: its vertex, the bone index or code of its group and its weight.
+	Returns the 4 strongest bone ids and normalized weights per vertex, whether it is weighted at all,
+	and (value, mask) pairs for unk0, residue and fur_length."""
+	entry_verts = np.asarray(entry_verts, dtype=np.int64)
+	entry_codes = np.asarray(entry_codes, dtype=np.int64)
+	entry_weights = np.asarray(entry_weights, dtype=np.float64)
+	table = {}
+	for name, code in (("unk0", UNK0), ("residue", RESIDUE), ("fur_length", FUR_LENGTH)):
+		sel = entry_codes == code
+		# only store the fur_length hack for shells, never for fins
+		if code == FUR_LENGTH and not use_fur_length:
+			sel[:] = False
+		values = np.zeros(num_verts, dtype=np.int64 if code == RESIDUE else np.float64)
+		mask = np.zeros(num_verts, dtype=bool)
+		values[entry_verts[sel]] = entry_weights[sel]
+		mask[entry_verts[sel]] = True
+		table[name] = (values, mask)
+
+	# sort each vertex's bone influences by descending weight, keeping the group order for ties
+	bones = entry_codes >= 0
+	b_verts, b_ids, b_weights = entry_verts[bones], entry_codes[bones], entry_weights[bones]
+	order = np.lexsort((np.arange(len(b_verts)), -b_weights, b_verts))
+	b_verts, b_ids, b_weights = b_verts[order], b_ids[order], b_weights[order]
+	rank = np.arange(len(b_verts)) - np.searchsorted(b_verts, b_verts, side="left")
+	# get the 4 strongest influences, missing ones are padded with empty bones
+	top = rank < 4
+	bone_ids = np.zeros((num_verts, 4), dtype=np.int64)
+	bone_weights = np.zeros((num_verts, 4), dtype=np.float64)
+	bone_ids[b_verts[top], rank[top]] = b_ids[top]
+	bone_weights[b_verts[top], rank[top]] = b_weights[top]
+	# normalize, summing in the same order as the python loop did to get the same floats
+	sw = ((bone_weights[:, 0] + bone_weights[:, 1]) + bone_weights[:, 2]) + bone_weights[:, 3]
+	weighted = sw > 0.0
+	bone_weights[weighted] /= sw[weighted, None]
+	table["bone_ids"] = bone_ids
+	table["bone_weights"] = bone_weights
+	table["weighted"] = weighted
+	return table
+
+
+def carry_forward(values, mask, indices, default):
+	"""Returns values for a sequence of vertex indices, where vertices without a value (mask False)
+	inherit the value of the last vertex in the sequence that had one, or the default"""
+	last = np.where(mask[indices], np.arange(len(indices)), -1)
+	np.maximum.accumulate(last, out=last)
+	seq_values = values[indices][np.maximum(last, 0)].tolist()
+	return [value if i >= 0 else default for value, i in zip(seq_values, last.tolist())]
+
+
+def vertex_dtype(num_uvs, num_vcols):
+	"""Returns the dtype of a buffer of unpacked mdl2 vertices, its fields are in the order model.set_verts() unpacks them"""
+	return np.dtype([
+		("position", np.float64, 3),
+		("residue", np.int64),
+		("normal", np.float64, 3),
+		("unk_0", np.float64),
+		("tangent", np.float64, 3),
+		("bone_index", np.int64),
+		("uvs", np.float64, (num_uvs, 2)),
+		("vcols", np.float64, (num_vcols, 4)),
+		("bone_ids", np.int64, 4),
+		("bone_weights", np.float64, 4),
+		# nan if the vertex has no fur length
+		("fur_length", np.float64),
+	])
+
+
+def vertex_tuples(verts):
+	"""Returns the vertices as a list of tuples, like model.set_verts() expects them"""
+	rows = verts.tolist()
+	return [row[:10] + (None if np.isnan(row[10]) else row[10], ) for row in rows]
+
+
+def split_model(arrays):
+	"""Splits the vertices of a triangulated mesh on uv seams and hard edges into mdl2 vertices.
+	arrays is a dict of the plain arrays extracted from a blender mesh, see export_mdl2.extract_arrays.
+	Returns the triangles and the data of the mdl2 vertices, in vertex buffer order."""
+	face_loops = arrays["face_loops"]
+	loop_vertex_indices = arrays["loop_vertex_indices"]
+	positions = arrays["positions"]
+	tangents = arrays["tangents"]
+	loop_uvs = arrays["loop_uvs"]
+
+	# use the packed float32 bytes of position, the first two uv layers and tangent as key for each face corner
+	keys = np.concatenate((
+		positions[loop_vertex_indices[face_loops]],
+		loop_uvs[face_loops, :2].reshape(len(face_loops), -1).astype(np.float32),
+		tangents[face_loops]), axis=1)
+	unique_corners, corner_to_unique = unique_rows(keys)
+	unique_loops = face_loops[unique_corners]
+	unique_vertex_indices = loop_vertex_indices[unique_loops]
+
+	# resolve the weights once per blender vertex, no matter how often it was split
+	weights = weights_table(
+		len(positions), arrays["entry_verts"], arrays["entry_codes"], arrays["entry_weights"], arrays["use_fur_length"])
+	weighted = weights["weighted"][unique_vertex_indices]
+
+	loop_vcols = arrays["loop_vcols"]
+	verts = np.empty(len(unique_loops), dtype=vertex_dtype(loop_uvs.shape[1], len(loop_vcols)))
+	verts["position"] = positions[unique_vertex_indices]
+	verts["normal"] = arrays["normals"][unique_loops]
+	verts["tangent"] = tangents[unique_loops]
+	verts["uvs"] = loop_uvs[unique_loops]
+	for i, layer in enumerate(loop_vcols):
+		verts["vcols"][:, i] = layer[unique_loops]
+	verts["bone_ids"] = weights["bone_ids"][unique_vertex_indices]
+	verts["bone_weights"] = weights["bone_weights"][unique_vertex_indices]
+	# the index for the skin partition is the bone with the highest weight
+	verts["bone_index"] = verts["bone_ids"][:, 0]
+	# unk0, residue and fur_length keep the value of the last vertex that had them, in vertex buffer order
+	verts["unk_0"] = carry_forward(*weights["unk0"], unique_vertex_indices, 0)
+	verts["residue"] = carry_forward(*weights["residue"], unique_vertex_indices, 1)
+	verts["fur_length"] = carry_forward(*weights["fur_length"], unique_vertex_indices, np.nan)
+	return {
+		"tris": corner_to_unique.reshape(-1, 3),
+		"count_reused": len(face_loops) - len(unique_corners),
+		"verts": verts,
+		"unweighted": np.unique(unique_vertex_indices[~weighted]),
+	}
@@ -0,0 +1,22 @@
+def group_weights(weights, rename=None):
+	"""Groups the weights of a model's vertices by bone and weight, so that each group can be assigned in one go.
+	weights is a list of (bone name, weight) tuples for each vertex, rename optionally translates the bone names.
+	Returns {bone name: {weight: [vertex indices]}}, if a vertex has a bone twice its last weight wins."""
+	# bone names are translated only once
+	names = {}
+	# bone name -> {vertex index: weight}
+	bone_weights = {}
+	for i, vert in enumerate(weights):
+		for bone_name, weight in vert:
+			try:
+				name = names[bone_name]
+			except KeyError:
+				name = names[bone_name] = rename(bone_name) if rename else bone_name
+			bone_weights.setdefault(name, {})[i] = weight
+
+	groups = {}
+	for name, vert_weights in bone_weights.items():
+		weight_verts = groups[name] = {}
+		for i, weight in vert_weights.items():
+			weight_verts.setdefault(weight, []).append(i)
+	return groups
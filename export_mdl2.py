@@ -1,312 +1,412 @@
-import os
-import time
-import struct
-
-import bpy
-import mathutils
-import math
-from .utils import matrix_util
-from .pyffi_ext.formats.ms2 import Ms2Format
-
-MAX_USHORT = 65535
-
-
-def get_armature():
-	src_armatures = [ob for ob in bpy.data.objects if type(ob.data) == bpy.types.Armature]
-	# do we have armatures?
-	if src_armatures:
-		# see if one of these is selected
-		if len(src_armatures) > 1:
-			sel_armatures = [ob for ob in src_armatures if ob.select_get()]
-			if sel_armatures:
-				return sel_armatures[0]
-		return src_armatures[0]
-
-
-
-
-def ensure_tri_modifier(ob):
-	"""Makes sure that ob has a triangulation modifier in its stack."""
-	for mod in ob.modifiers:
-		if mod.type in ('TRIANGULATE',):
-			break
-	else:
-		ob.modifiers.new('Triangulate', 'TRIANGULATE')
-
-
-def handle_transforms(ob, me, errors, apply=True):
-	"""Ensures that non-zero object transforms are either applied or reported"""
-	identity = mathutils.Matrix()
-	# the world space transform of every rigged mesh must be neutral
-	if ob.matrix_world != identity:
-		if apply:
-			# we only transform the evaluated mesh and leave the actual scene alone
-			me.transform(ob.matrix_world)
-			errors.append(ob.name+" has had its object transforms applied on the fly to avoid ingame distortion!")
-		else:
-			# we simply ignore the transforms and export the mesh as is, but warn the user
-			errors.append(f"Ignored object transforms for {ob.name} - orientation will not match what you see in blender!")
-
-
-def save(operator, context, filepath='', apply_transforms=False):
-	errors = []
-	start_time = time.time()
-
-	# ensure that we have objects in the scene
-	if bpy.context.scene.objects:
-		# operator needs an active object, set one if missing (eg. user had deleted the active object)
-		if not bpy.context.view_layer.objects.active:
-			bpy.context.view_layer.objects.active = bpy.context.scene.objects[0]
-		# now enter object mode on the active object, if we aren't already in it
-		bpy.ops.object.mode_set(mode="OBJECT")
-	else:
-		return ("No objects in scene, nothing to export!", )
-
-	print(f"\nExporting {filepath} into export subfolder...")
-	if not os.path.isfile(filepath):
-		errors.append(f"{filepath} does not exist. You must open an existing MDL2 file for exporting.")
-		return errors
-
-	data = Ms2Format.Data()
-	# open file for binary reading
-	with open(filepath, "rb") as stream:
-		data.read(stream, data, file=filepath, quick=True)
-
-		b_armature_ob = get_armature()
-		if not b_armature_ob:
-			errors.append(f"No armature was found - did you delete it?")
-			return errors
-		# clear pose
-		for pbone in b_armature_ob.pose.bones:
-			pbone.matrix_basis = mathutils.Matrix()
-
-		bone_names = data.bone_names
-		# used to get index from bone name for faster weights
-		bones_table = dict( (matrix_util.bone_name_for_blender(bone_name), bone_i) for bone_i, bone_name in enumerate(bone_names) )
-		#old_bone_info = data.bone_info
-		bone_parents = data.bone_info.bone_parents#old_bones = old_bone_info.jwe_bones
-		old_bone_names = [matrix_util.bone_name_for_blender(n) for n in data.bone_names]
-		boness = b_armature_ob.data.bones
-		bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-		#edit_bones = b_armature_ob.data.edit_bones
-		mats = {}
-		bones = data.bone_info.jwe_bones
-		idx = 0
-		for bone_name, bb, o_parent_ind in zip(old_bone_names, bones, bone_parents):
-			if idx in (0,1):
-				print(idx)
-			else:
-				bbb = boness.get(bone_name)
-				#ebb = edit_bones(bone_name)
-				print(bone_name)
-				print(data.bone_info.inverse_bind_matrices[idx])
-				print("old: ",bb)
-				#print(matrix_util.nif_bind_to_blender_bind(matrix_util.import_matrix(data.bone_info.inverse_bind_matrices[idx]).inverted_safe()))
-				if bbb.parent is None:
-					mat_local_to_parent = bbb.matrix_local
-				else:
-					parent_name = old_bone_names[o_parent_ind]
-					mat_local_to_parent = bbb.parent.matrix_local.inverted() @ bbb.matrix_local
-				data.bone_info.inverse_bind_matrices[idx].set_rows(*matrix_util.blender_bind_to_nif_bind(bbb.matrix_local).inverted())
-				print(data.bone_info.inverse_bind_matrices[idx])
-				bb.set_bone(mat_local_to_parent)
-
-				print(" ")
-				print("new: ",bb)
-			idx+=1
-		bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-		# ensure that these are initialized
-		for model in data.mdl2_header.models:
-			model.tri_indices = []
-			model.verts = []
-
-		for ob in bpy.data.objects:
-			if type(ob.data) == bpy.types.Mesh:
-				print("\nNext mesh...")
-
-				# make sure the model has a triangulation modifier
-				ensure_tri_modifier(ob)
-
-				# make a copy with all modifiers applied
-				dg = bpy.context.evaluated_depsgraph_get()
-				eval_obj = ob.evaluated_get(dg)
-				me = eval_obj.to_mesh(preserve_all_data_layers=True, depsgraph=dg)
-				handle_transforms(eval_obj, me, errors, apply=apply_transforms)
-
-				# get the index of this model in the mdl2 model buffer
-				try:
-					ind = int(ob.name.rsplit("_model", 1)[1])
-				except:
-					print("Bad name, skipping",ob.name)
-					continue
-				print("Model slot",ind)
-
-				# we get the corresponding mdl2 model
-				model = data.mdl2_header.models[ind]
-				# perhaps we want to update model.flag from ob["flag"]
-				model.update_dtype()
-				num_uvs = model.get_uv_count()
-				num_vcols = model.get_vcol_count()
-				print("num_uvs",num_uvs)
-				print("num_vcols",num_vcols)
-
-				if not len(me.vertices):
-					errors.append(f"Model {ob.name} has no vertices!")
-					return errors
-
-				if not len(me.polygons):
-					errors.append(f"Model {ob.name} has no polygons!")
-					return errors
-
-				if len(me.uv_layers) != num_uvs:
-					errors.append(f"Model {ob.name} has {len(me.uv_layers)} UV layers, but {num_uvs} were expected!")
-					return errors
-
-				if len(me.vertex_colors) != num_vcols:
-					errors.append(f"Model {ob.name} has {len(me.vertex_colors)} Vertex Color layers, but {num_vcols} were expected!")
-					return errors
-
-				unweighted_vertices = []
-				tris = []
-				# tangents have to be pre-calculated
-				# this will also calculate loop normal
-				me.calc_tangents()
-				# stores values retrieved from blender, will be packed into array by pyffi
-				verts = []
-				# use a dict mapping dummy vertices to their index for fast lookup
-				# this is used to convert blender vertices (several UVs, normals per face corner) to mdl2 vertices
-				dummy_vertices = {}
-				count_unique = 0
-				count_reused = 0
-				# defaults that may or may not be set later on
-				unk_0 = 0
-				residue = 1
-				fur_length = None
-				# loop faces and collect unique and repeated vertices
-				for face in me.polygons:
-					if len(face.loop_indices) != 3:
-						# this is a bug - we are applying the triangulation modifier above
-						errors.append(f"Model {ob.name} is not triangulated!")
-						return errors
-					# build indices into vertex buffer for the current face
-					tri = []
-					# loop over face loop to get access to face corner data (normals, uvs, vcols, etc)
-					for loop_index in face.loop_indices:
-						b_loop = me.loops[loop_index]
-						b_vert = me.vertices[b_loop.vertex_index]
-
-						# get the vectors
-						position = b_vert.co
-						tangent = b_loop.tangent
-						normal = b_loop.normal
-						uvs = [(layer.data[loop_index].uv.x, 1-layer.data[loop_index].uv.y) for layer in me.uv_layers]
-						# create a dummy bytes str for indexing
-						float_items = [*position, *[c for uv in uvs[:2] for c in uv], *tangent]
-						dummy = struct.pack(f'<{len(float_items)}f', *float_items)
-						# see if this dummy key exists
-						try:
-							# if it does - reuse it by grabbing its index from the dict
-							v_index = dummy_vertices[dummy]
-							count_reused += 1
-						except:
-							# it doesn't, so we have to fill in additional data
-							v_index = count_unique
-							dummy_vertices[dummy] = v_index
-							count_unique += 1
-
-							# now collect any missing vert data that was not needed for the splitting of blender verts
-
-							# collect vertex colors
-							vcols = [(x for x in layer.data[loop_index].color) for layer in me.vertex_colors]
-
-							# get the weights
-							w = []
-							for vertex_group in b_vert.groups:
-								vgroup_name = ob.vertex_groups[vertex_group.group].name
-								# get the unk0
-								if vgroup_name == "unk0":
-									unk_0 = vertex_group.weight
-								elif vgroup_name == "residue":
-									residue = int(vertex_group.weight)
-								elif vgroup_name == "fur_length":
-									# only store this hack for shells, never for fins
-									if model.flag in (885,1013,821):
-										fur_length = vertex_group.weight
-								else:
-									# avoid check for dummy vertex groups without corresponding bones
-									try:
-										w.append([bones_table[vgroup_name], vertex_group.weight])
-									except:
-										try:
-											w.append([int(vgroup_name), vertex_group.weight])
-										except:
-											errors.append(f"Ignored extraneous vertex group {vgroup_name} on mesh {ob.name}!")
-							# get the 4 strongest influences on this vert
-							w_s = sorted(w, key=lambda x: x[1], reverse=True)[0:4]
-							# pad the weight list to 4 bones, ie. add empty bones if missing
-							for i in range(0, 4-len(w_s)): w_s.append([0, 0])
-							# summed weights
-							sw = sum(w[1] for w in w_s)
-							# print(sw)
-							if sw > 0.0:
-								# normalize
-								for x in range(4):
-									w_s[x][1] /= sw
-							elif b_loop.vertex_index not in unweighted_vertices:
-								# print("Sum of weights",sw)
-								unweighted_vertices.append(b_loop.vertex_index)
-							if v_index > MAX_USHORT:
-								errors.append(f"{ob.name} has too many MDL2 verts. The limit is {MAX_USHORT}. \nBlender vertices have to be duplicated on every UV seam, hence the increase.")
-								return errors
-
-							# ensure that we have 4 weights at this point
-							assert (len(w_s) == 4)
-							# split the list of tuples into two separate lists
-							bone_ids, bone_weights = zip(*w_s)
-							# get the index for the skin partition - the bone with the highest weight
-							bone_index = w_s[0][0]
-							# store all raw blender data for pyffi
-							verts.append((position, residue, normal, unk_0, tangent, bone_index, uvs, vcols, bone_ids, bone_weights, fur_length))
-						tri.append(v_index)
-					tris.append(tri)
-
-				print("count_unique",count_unique)
-				print("count_reused",count_reused)
-
-				# report unweighted vertices
-				if model.flag not in (513,):
-					if unweighted_vertices:
-						errors.append(f"{ob.name} has {len(unweighted_vertices)} unweighted vertices!")
-						return errors
-
-				# set shell count if not present
-				if "add_shells" in ob:
-					shell_count = ob["add_shells"]
-				else:
-					shell_count = 0
-					ob["add_shells"] = 0
-				# extend tri array according to shell count
-				print("Got to add shells",shell_count)
-				out_tris = list(tris)
-				for shell in range(shell_count):
-					print("Shell",shell)
-					out_tris.extend(tris)
-
-				# update vert & tri array
-				model.base = data.mdl2_header.model_info.pack_offset
-				# transfer raw verts into model data packed array
-				model.set_verts(verts)
-				model.tris = out_tris
-
-		# check if any modeldata is empty
-		for i, model in enumerate(data.mdl2_header.models):
-			if not model.tri_indices or not model.verts:
-				errors.append(f"MDL2 Modeldata #{i} has not been populated. \nEnsure that the name of the blender model for that number follows the naming convention.")
-				return errors
-
-		# write modified data
-		data.write(stream, data, file=filepath)
-
-	print(f"\nFinished Mdl2 Export in {time.time()-start_time:.2f} seconds")
-	# only return unique errors
-	return set(errors)
+import os
+import sys
+import time
+import hashlib
+import pickle
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bpy
+import mathutils
+import math
+import numpy as np
+from .utils import matrix_util, skeleton, log
+from .cobra_core import split, shells
+
+logger = log.get_logger("export")
+from .pyffi_ext.formats.ms2 import Ms2Format
+
+MAX_USHORT = 65535
+# upper bound for the summed size of the split vertices kept for incremental exports
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# (mdl2 path, model index) -> (fingerprint, split result, size) of the last export of each model,
+# least recently used first
+export_cache = OrderedDict()
+# script that splits models in worker processes
+SPLIT_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "split_worker.py")
+# below this many face corners in all models, starting the workers takes longer than splitting serially
+MIN_PARALLEL_CORNERS = 200000
+
+
+def get_armature():
+	src_armatures = [ob for ob in bpy.data.objects if type(ob.data) == bpy.types.Armature]
+	# do we have armatures?
+	if src_armatures:
+		# see if one of these is selected
+		if len(src_armatures) > 1:
+			sel_armatures = [ob for ob in src_armatures if ob.select_get()]
+			if sel_armatures:
+				return sel_armatures[0]
+		return src_armatures[0]
+
+
+
+
+def foreach_get(collection, attribute, width=1, dtype=np.float32):
+	"""Returns an attribute of all items of a bpy collection as a numpy array"""
+	array = np.empty(len(collection) * width, dtype=dtype)
+	collection.foreach_get(attribute, array)
+	return array.reshape(-1, width) if width > 1 else array
+
+
+def get_group_bones(ob, bones_table):
+	"""Returns an array mapping the vertex group indices of ob to bone indices or special codes"""
+	group_bones = np.full(len(ob.vertex_groups), split.EXTRANEOUS, dtype=np.int64)
+	specials = {"unk0": split.UNK0, "residue": split.RESIDUE, "fur_length": split.FUR_LENGTH}
+	for vertex_group in ob.vertex_groups:
+		vgroup_name = vertex_group.name
+		if vgroup_name in specials:
+			group_bones[vertex_group.index] = specials[vgroup_name]
+		elif vgroup_name in bones_table:
+			group_bones[vertex_group.index] = bones_table[vgroup_name]
+		else:
+			# avoid check for dummy vertex groups without corresponding bones
+			try:
+				group_bones[vertex_group.index] = int(vgroup_name)
+			except ValueError:
+				pass
+	return group_bones
+
+
+def extract_arrays(ob, me, bones_table, use_fur_length):
+	"""Pulls everything the mdl2 vertex splitting needs out of a triangulated blender mesh, as plain arrays.
+	This has to run on the main thread, the arrays can then be processed anywhere."""
+	# tangents have to be pre-calculated
+	# this will also calculate loop normal
+	me.calc_tangents()
+	# get the loops of all faces, in face order
+	loop_starts = foreach_get(me.polygons, "loop_start", dtype=np.int32)
+	face_loops = (loop_starts[:, None] + np.arange(3, dtype=np.int32)).ravel()
+	# flip V in double precision, so the values are the same as when computed per vertex in python
+	loop_uvs = np.zeros((len(me.loops), len(me.uv_layers), 2), dtype=np.float64)
+	for uv_i, layer in enumerate(me.uv_layers):
+		loop_uvs[:, uv_i] = foreach_get(layer.data, "uv", 2)
+	loop_uvs[:, :, 1] = 1.0 - loop_uvs[:, :, 1]
+	# vertex group assignments are the only data that has to be read per vertex in python
+	group_bones = get_group_bones(ob, bones_table)
+	entries = np.array([(v.index, g.group, g.weight) for v in me.vertices for g in v.groups], dtype=np.float64).reshape(-1, 3)
+	entry_groups = entries[:, 1].astype(np.int64)
+	entry_codes = group_bones[entry_groups]
+	return {
+		"face_loops": face_loops,
+		"positions": foreach_get(me.vertices, "co", 3),
+		"loop_vertex_indices": foreach_get(me.loops, "vertex_index", dtype=np.int32),
+		"tangents": foreach_get(me.loops, "tangent", 3),
+		"normals": foreach_get(me.loops, "normal", 3),
+		"loop_uvs": loop_uvs,
+		"loop_vcols": [foreach_get(layer.data, "color", 4) for layer in me.vertex_colors],
+		"entry_verts": entries[:, 0].astype(np.int64),
+		"entry_codes": entry_codes,
+		"entry_weights": entries[:, 2],
+		"use_fur_length": use_fur_length,
+		"extraneous": sorted(set(ob.vertex_groups[g].name for g in entry_groups[entry_codes == split.EXTRANEOUS].tolist())),
+	}
+
+
+def get_fingerprint(arrays):
+	"""Hashes the arrays that extract_arrays pulled out of the evaluated mesh, which are all the vertex splitting reads.
+	As the evaluated mesh is hashed, shape keys, drivers, modifiers and auto smooth are covered."""
+	fingerprint = hashlib.blake2b(digest_size=16)
+	for name, value in sorted(arrays.items()):
+		fingerprint.update(name.encode())
+		for array in (value if isinstance(value, list) else (value, )):
+			if isinstance(array, np.ndarray):
+				fingerprint.update(repr((array.dtype.str, array.shape)).encode())
+				fingerprint.update(np.ascontiguousarray(array).data)
+			else:
+				fingerprint.update(repr(array).encode())
+	return fingerprint.hexdigest()
+
+
+def get_cached(cache_key, fingerprint):
+	"""Returns the split result of the last export of a model, if it had the same fingerprint"""
+	entry = export_cache.get(cache_key)
+	if entry and entry[0] == fingerprint:
+		export_cache.move_to_end(cache_key)
+		return entry[1]
+
+
+def set_cached(cache_key, fingerprint, result):
+	size = sum(value.nbytes for value in result.values() if isinstance(value, np.ndarray))
+	export_cache[cache_key] = (fingerprint, result, size)
+	export_cache.move_to_end(cache_key)
+	# drop the least recently exported models
+	while sum(entry[2] for entry in export_cache.values()) > MAX_CACHE_BYTES:
+		export_cache.popitem(last=False)
+
+
+def get_python_executable():
+	"""Returns the python interpreter for worker processes, older blenders report their own binary as sys.executable"""
+	return getattr(bpy.app, "binary_path_python", "") or sys.executable
+
+
+def run_split_worker(all_arrays):
+	"""Splits models in a python process that runs split_worker.py, which neither imports bpy nor the add-on"""
+	proc = subprocess.run(
+		[get_python_executable(), SPLIT_WORKER], input=pickle.dumps(all_arrays, protocol=pickle.HIGHEST_PROTOCOL),
+		stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	if proc.returncode:
+		raise OSError(f"Split worker exited with code {proc.returncode}:\n{proc.stderr.decode(errors='replace')}")
+	return pickle.loads(proc.stdout)
+
+
+def split_parallel(all_arrays):
+	"""Splits models in worker processes, each gets about the same number of face corners"""
+	num_workers = min(len(all_arrays), os.cpu_count() or 1)
+	chunks = [[] for _ in range(num_workers)]
+	loads = [0] * num_workers
+	# hand out the biggest models first, always to the worker with the least corners so far
+	for i in sorted(range(len(all_arrays)), key=lambda i: -len(all_arrays[i]["face_loops"])):
+		worker_i = loads.index(min(loads))
+		chunks[worker_i].append(i)
+		loads[worker_i] += len(all_arrays[i]["face_loops"])
+	# the threads only wait for the processes
+	with ThreadPoolExecutor(max_workers=num_workers) as pool:
+		chunk_results = list(pool.map(run_split_worker, [[all_arrays[i] for i in chunk] for chunk in chunks]))
+	results = [None] * len(all_arrays)
+	for chunk, chunk_result in zip(chunks, chunk_results):
+		for i, result in zip(chunk, chunk_result):
+			results[i] = result
+	return results
+
+
+def split_models(all_arrays, use_multiprocessing=False):
+	"""Runs the vertex splitting for all extracted models, in worker processes if requested and worth it"""
+	num_corners = sum(len(arrays["face_loops"]) for arrays in all_arrays)
+	if use_multiprocessing and len(all_arrays) > 1 and num_corners >= MIN_PARALLEL_CORNERS:
+		try:
+			return split_parallel(all_arrays)
+		# errors of the splitting itself are raised again by the serial splitting
+		except (OSError, pickle.PicklingError, pickle.UnpicklingError, EOFError):
+			logger.warning("Parallel packing failed, packing serially instead", exc_info=True)
+	return [split.split_model(arrays) for arrays in all_arrays]
+
+
+def ensure_tri_modifier(ob):
+	"""Makes sure that ob has a triangulation modifier in its stack."""
+	for mod in ob.modifiers:
+		if mod.type in ('TRIANGULATE',):
+			break
+	else:
+		ob.modifiers.new('Triangulate', 'TRIANGULATE')
+
+
+def handle_transforms(ob, me, errors, apply=True):
+	"""Ensures that non-zero object transforms are either applied or reported"""
+	identity = mathutils.Matrix()
+	# the world space transform of every rigged mesh must be neutral
+	if ob.matrix_world != identity:
+		if apply:
+			# we only transform the evaluated mesh and leave the actual scene alone
+			me.transform(ob.matrix_world)
+			errors.append(ob.name+" has had its object transforms applied on the fly to avoid ingame distortion!")
+		else:
+			# we simply ignore the transforms and export the mesh as is, but warn the user
+			errors.append(f"Ignored object transforms for {ob.name} - orientation will not match what you see in blender!")
+
+
+def read_mdl2_quick(file_path):
+	data = Ms2Format.Data()
+	with open(file_path, "rb") as stream:
+		data.read(stream, data, file=file_path, quick=True)
+	return data
+
+
+def save(operator, context, filepath='', apply_transforms=False, use_multiprocessing=False, incremental=False, timer=None):
+	errors = []
+	start_time = time.time()
+	# sums up the time of each stage over all models
+	timer = timer or log.StageTimer()
+
+	# ensure that we have objects in the scene
+	if bpy.context.scene.objects:
+		# operator needs an active object, set one if missing (eg. user had deleted the active object)
+		if not bpy.context.view_layer.objects.active:
+			bpy.context.view_layer.objects.active = bpy.context.scene.objects[0]
+		# now enter object mode on the active object, if we aren't already in it
+		bpy.ops.object.mode_set(mode="OBJECT")
+	else:
+		return ("No objects in scene, nothing to export!", )
+
+	logger.info(f"Exporting {filepath} into export subfolder...")
+	if not os.path.isfile(filepath):
+		errors.append(f"{filepath} does not exist. You must open an existing MDL2 file for exporting.")
+		return errors
+
+	# the data is modified, so it is read from disk instead of shared with the cache
+	# a deep copy of the parsed tree is not reliably cheaper than parsing it again
+	with timer.stage("parse"):
+		data = read_mdl2_quick(filepath)
+	# open file for binary reading, the writer still gets the source stream
+	with open(filepath, "rb") as stream:
+		b_armature_ob = get_armature()
+		if not b_armature_ob:
+			errors.append(f"No armature was found - did you delete it?")
+			return errors
+		with timer.stage("armature"):
+			# clear pose
+			for pbone in b_armature_ob.pose.bones:
+				pbone.matrix_basis = mathutils.Matrix()
+
+			skel = skeleton.get_skeleton(b_armature_ob)
+			#old_bone_info = data.bone_info
+			bone_parents = data.bone_info.bone_parents#old_bones = old_bone_info.jwe_bones
+			old_bone_names = [matrix_util.bone_name_for_blender(n) for n in data.bone_names]
+			# used to get index from bone name for faster weights, the indices have to follow the bone order of the mdl2
+			if skel.names == old_bone_names:
+				bones_table = skel.index
+			else:
+				bones_table = dict( (bone_name, bone_i) for bone_i, bone_name in enumerate(old_bone_names) )
+			bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+			#edit_bones = b_armature_ob.data.edit_bones
+			mats = {}
+			bones = data.bone_info.jwe_bones
+			idx = 0
+			for bone_name, bb, o_parent_ind in zip(old_bone_names, bones, bone_parents):
+				if idx in (0,1):
+					logger.debug(f"Skipped bone {idx}")
+				else:
+					bone_i = skel.index[bone_name]
+					#ebb = edit_bones(bone_name)
+					logger.debug("%s\n%s\nold: %s", bone_name, data.bone_info.inverse_bind_matrices[idx], bb)
+					#print(matrix_util.nif_bind_to_blender_bind(matrix_util.import_matrix(data.bone_info.inverse_bind_matrices[idx]).inverted_safe()))
+					# rest matrix relative to the parent, or the armature for roots
+					mat_local_to_parent = mathutils.Matrix(skel.local_matrices[bone_i].tolist())
+					data.bone_info.inverse_bind_matrices[idx].set_rows(*mathutils.Matrix(skel.ms2_matrices[bone_i].tolist()).inverted())
+					bb.set_bone(mat_local_to_parent)
+					logger.debug("%s\nnew: %s", data.bone_info.inverse_bind_matrices[idx], bb)
+				idx+=1
+			bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+		# ensure that these are initialized
+		for model in data.mdl2_header.models:
+			model.tri_indices = []
+			model.verts = []
+
+		pack_offset = data.mdl2_header.model_info.pack_offset
+		# pull the raw arrays of all changed models out of blender first
+		exported = []
+		for ob in bpy.data.objects:
+			if type(ob.data) == bpy.types.Mesh:
+				# get the index of this model in the mdl2 model buffer
+				try:
+					ind = int(ob.name.rsplit("_model", 1)[1])
+				except:
+					logger.warning(f"Bad name, skipping {ob.name}")
+					continue
+				logger.debug(f"{ob.name} goes to model slot {ind}")
+
+				# make sure the model has a triangulation modifier
+				ensure_tri_modifier(ob)
+
+				# we get the corresponding mdl2 model
+				model = data.mdl2_header.models[ind]
+				# perhaps we want to update model.flag from ob["flag"]
+				model.update_dtype()
+				num_uvs = model.get_uv_count()
+				num_vcols = model.get_vcol_count()
+				logger.debug(f"num_uvs {num_uvs}, num_vcols {num_vcols}")
+
+				# set shell count if not present
+				if "add_shells" not in ob:
+					ob["add_shells"] = 0
+				shell_count = ob["add_shells"]
+
+				# make a copy with all modifiers applied
+				model_errors = []
+				with timer.stage("evaluate"):
+					dg = bpy.context.evaluated_depsgraph_get()
+					eval_obj = ob.evaluated_get(dg)
+					me = eval_obj.to_mesh(preserve_all_data_layers=True, depsgraph=dg)
+					handle_transforms(eval_obj, me, model_errors, apply=apply_transforms)
+
+				if not len(me.vertices):
+					errors.append(f"Model {ob.name} has no vertices!")
+					return errors
+
+				if not len(me.polygons):
+					errors.append(f"Model {ob.name} has no polygons!")
+					return errors
+
+				if len(me.uv_layers) != num_uvs:
+					errors.append(f"Model {ob.name} has {len(me.uv_layers)} UV layers, but {num_uvs} were expected!")
+					return errors
+
+				if len(me.vertex_colors) != num_vcols:
+					errors.append(f"Model {ob.name} has {len(me.vertex_colors)} Vertex Color layers, but {num_vcols} were expected!")
+					return errors
+
+				loop_totals = foreach_get(me.polygons, "loop_total", dtype=np.int32)
+				if np.any(loop_totals != 3):
+					# this is a bug - we are applying the triangulation modifier above
+					errors.append(f"Model {ob.name} is not triangulated!")
+					return errors
+
+				with timer.stage("extract"):
+					arrays = extract_arrays(ob, me, bones_table, use_fur_length=model.flag in (885,1013,821))
+					eval_obj.to_mesh_clear()
+				for vgroup_name in arrays["extraneous"]:
+					model_errors.append(f"Ignored extraneous vertex group {vgroup_name} on mesh {ob.name}!")
+				errors.extend(model_errors)
+
+				# skip splitting if the model has not changed since it was last split
+				cache_key = (os.path.normcase(os.path.abspath(filepath)), ind)
+				fingerprint = None
+				if incremental:
+					with timer.stage("fingerprint"):
+						fingerprint = get_fingerprint(arrays)
+					# keep the result, the cache may drop it while the other models are packed
+					result = get_cached(cache_key, fingerprint)
+					if result:
+						exported.append((ob, model, None, shell_count, cache_key, fingerprint, result))
+						continue
+				exported.append((ob, model, arrays, shell_count, cache_key, fingerprint, None))
+
+		# the vertex splitting of the models is independent, so it can run in parallel
+		to_split = [arrays for ob, model, arrays, shell_count, cache_key, fingerprint, result in exported if arrays]
+		with timer.stage("split"):
+			results = iter(split_models(to_split, use_multiprocessing))
+		logger.info(f"Split vertices of {len(to_split)} models, reused {len(exported)-len(to_split)}")
+
+		for ob, model, arrays, shell_count, cache_key, fingerprint, result in exported:
+			if arrays:
+				result = next(results)
+			else:
+				logger.debug(f"{ob.name} has not changed since the last export, reusing its split vertices")
+			verts = result["verts"]
+			count_unique = len(verts)
+			logger.debug(f"{ob.name} count_unique {count_unique}, count_reused {result['count_reused']}")
+			if count_unique - 1 > MAX_USHORT:
+				errors.append(f"{ob.name} has too many MDL2 verts. The limit is {MAX_USHORT}. \nBlender vertices have to be duplicated on every UV seam, hence the increase.")
+				return errors
+
+			# report unweighted vertices
+			if model.flag not in (513,):
+				if len(result["unweighted"]):
+					errors.append(f"{ob.name} has {len(result['unweighted'])} unweighted vertices!")
+					return errors
+
+			# update vert & tri array
+			with timer.stage("pack"):
+				model.base = pack_offset
+				model.set_verts(split.vertex_tuples(verts))
+				# extend tri array according to shell count, each shell reuses the base tris
+				logger.debug(f"Got to add shells {shell_count}")
+				model.tris = shells.replicate_tris(result["tris"], shell_count)
+			if arrays and fingerprint:
+				set_cached(cache_key, fingerprint, result)
+
+		# check if any modeldata is empty
+		for i, model in enumerate(data.mdl2_header.models):
+			if not len(model.tri_indices) or not len(model.verts):
+				errors.append(f"MDL2 Modeldata #{i} has not been populated. \nEnsure that the name of the blender model for that number follows the naming convention.")
+				return errors
+
+		# write modified data
+		with timer.stage("write"):
+			data.write(stream, data, file=filepath)
+
+	timer.log(logger, f"MDL2 export stages of {os.path.basename(filepath)}")
+	logger.info(f"Finished Mdl2 Export in {time.time()-start_time:.2f} seconds")
+	# only return unique errors
+	return set(errors)
@@ -1,151 +1,167 @@
-import os
-import time
-import math
-
-import bpy
-import mathutils
-
-from .utils import matrix_util
-from .pyffi_ext.formats.bani import BaniFormat
-
-def load_bani(file_path):
-	"""Loads a bani from the given file path"""
-	print("Importing {0}".format(file_path))
-
-	data = BaniFormat.Data()
-	# open file for binary reading
-	with open(file_path, "rb") as stream:
-		data.inspect_quick(stream)
-		data.read(stream, data, file=file_path)
-	return data
-	
-def get_armature():
-	src_armatures = [ob for ob in bpy.data.objects if type(ob.data) == bpy.types.Armature]
-	#do we have armatures?
-	if src_armatures:
-		#see if one of these is selected -> get only that one
-		if len(src_armatures) > 1:
-			sel_armatures = [ob for ob in src_armatures if ob.select_get()]
-			if sel_armatures:
-				return sel_armatures[0]
-		return src_armatures[0]
-	
-def create_anim(ob, anim_name):
-	action = bpy.data.actions.new(name = anim_name)
-	action.use_fake_user = True
-	ob.animation_data_create()
-	ob.animation_data.action = action
-	return action
-
-def ovl_bones(b_armature_data):
-	# first just get the roots, then extend it
-	roots = [bone for bone in b_armature_data.bones if not bone.parent]
-	# this_level = []
-	out_bones = roots
-	# next_level = []
-	for bone in roots:
-		out_bones += [child for child in bone.children]
-	bone_names = [b.name for b in out_bones]
-	if "srb" in bone_names:
-		bone_names.remove("srb")
-		bone_names.append("srb")
-	return bone_names
-	
-def load(operator, context, files = [], filepath = "", set_fps=False):
-	starttime = time.clock()
-	dirname, filename = os.path.split(filepath)
-	data = load_bani(filepath)
-
-	# data 0 has various scales and counts
-	anim_length = data.header.data_0.animation_length
-	num_frames = data.header.data_0.num_frames
-	
-	global_corr_euler = mathutils.Euler( [math.radians(k) for k in (0,-90,-90)] )
-	global_corr_mat = global_corr_euler.to_matrix().to_4x4()
-	
-	fps = int(round(num_frames/anim_length))
-	bpy.context.scene.frame_start = 0
-	bpy.context.scene.frame_end = num_frames-1
-	print("Banis fps", fps)
-	ob = get_armature()
-
-	bones_table = [(bone["index"], bone.name) for bone in ob.pose.bones]
-	bone_names = [tup[1] for tup in sorted(bones_table)]
-
-	# ns = ("def_rearLegUpr_joint.L", "def_rearLegUprHalfTwist_joint.L", "def_rearLegUprAllTwist_joint.L",
-	# 	  "def_rearLegLwr_joint.L", "def_rearLegLwrHalfTwist_joint.L", "def_rearLegLwrAllTwist_joint.L")
-	# # ns = ("def_c_neck_joint", "def_c_head_joint", "def_wing_joint.L", "def_wing02_joint.L", "def_wing_joint.R", "def_wing02_joint.R")
-	# # ns = ("def_rearHorselink_joint.L", "def_rearFoot_joint.L", "def_toeRearRing1_joint.L", "def_toeRearRing2_joint.L", "def_toeRearRing3_joint.L",
-	# # 	  "def_rearHorselink_joint.R", "def_rearFoot_joint.R", "def_toeRearRing1_joint.R", "def_toeRearRing2_joint.R", "def_toeRearRing3_joint.R")
-	#
-	# # a rotation is not relative to the parent, but relative to the rest pose
-	#
-	# for n in ns:
-	# 	i = bone_names.index(n)
-	# 	euler = data.eulers[0, i]
-	# 	# loc = data.locs[:, i]
-	# 	loc = data.locs[0, i]
-	# 	print(n, "euler", euler)
-	# 	print(n, "locat", loc)
-	# return
-	# bone_names = ovl_bones(ob.data)
-	# goliath imports fine with the correct name order
-	# bone_names = ['def_c_root_joint', 'def_c_hips_joint', 'def_c_spine1_joint', 'def_c_spine2_joint', 'def_c_chestBreath_joint', 'def_c_spine3_joint', 'def_c_chest_joint', 'def_c_neck1_joint', 'def_c_head_joint', 'def_c_jaw_joint', 'def_l_clavicle_joint', 'def_l_frontLegUpr_joint', 'def_l_frontLegLwr_joint', 'def_l_frontFoot_joint', 'def_l_toeFrontIndex1_joint', 'def_l_toeFrontIndex2_joint', 'def_l_toeFrontPinky1_joint', 'def_l_toeFrontPinky2_joint', 'def_l_toeFrontPinky3_joint', 'def_l_toeFrontRing1_joint', 'def_l_toeFrontRing2_joint', 'def_l_toeFrontRing3_joint', 'def_l_frontLegLwrAllTwist_joint', 'def_l_frontLegLwrHalfTwist_joint', 'def_l_frontLegUprAllTwist_joint', 'def_r_clavicle_joint', 'def_r_frontLegUpr_joint', 'def_r_frontLegLwr_joint', 'def_r_frontFoot_joint', 'def_r_toeFrontIndex1_joint', 'def_r_toeFrontIndex2_joint', 'def_r_toeFrontPinky1_joint', 'def_r_toeFrontPinky2_joint', 'def_r_toeFrontPinky3_joint', 'def_r_toeFrontRing1_joint', 'def_r_toeFrontRing2_joint', 'def_r_toeFrontRing3_joint', 'def_r_frontLegLwrAllTwist_joint', 'def_r_frontLegLwrHalfTwist_joint', 'def_r_frontLegUprAllTwist_joint', 'def_l_rearLegUpr_joint', 'def_l_rearLegLwr_joint', 'def_l_rearHorselink_joint', 'def_l_rearFoot_joint', 'def_l_toeRearMid1_joint', 'def_l_toeRearMid2_joint', 'def_l_toeRearMid3_joint', 'def_l_toeRearPinky1_joint', 'def_l_toeRearPinky2_joint', 'def_l_toeRearPinky3_joint', 'def_l_toeRearRing1_joint', 'def_l_toeRearRing2_joint', 'def_l_toeRearRing3_joint', 'def_l_toeRearThumb1_joint', 'def_l_toeRearThumb2_joint', 'def_l_toeRearThumb3_joint', 'def_l_rearLegLwrAllTwist_joint', 'def_l_rearLegLwrHalfTwist_joint', 'def_l_rearLegUprAllTwist_joint', 'def_r_rearLegUpr_joint', 'def_r_rearLegLwr_joint', 'def_r_rearHorselink_joint', 'def_r_rearFoot_joint', 'def_r_toeRearMid1_joint', 'def_r_toeRearMid2_joint', 'def_r_toeRearMid3_joint', 'def_r_toeRearPinky1_joint', 'def_r_toeRearPinky2_joint', 'def_r_toeRearPinky3_joint', 'def_r_toeRearRing1_joint', 'def_r_toeRearRing2_joint', 'def_r_toeRearRing3_joint', 'def_r_toeRearThumb1_joint', 'def_r_toeRearThumb2_joint', 'def_r_toeRearThumb3_joint', 'def_r_rearLegLwrAllTwist_joint', 'def_r_rearLegLwrHalfTwist_joint', 'def_r_rearLegUprAllTwist_joint', 'def_c_throat_joint', 'def_l_eyelidUpr_joint', 'def_r_eyelidUpr_joint', 'def_l_toeFrontIndex3_joint', 'def_l_toeFrontThumb1_joint', 'def_l_toeFrontThumb2_joint', 'def_l_toeFrontThumb3_joint', 'def_l_frontLegUprHalfTwist_joint', 'def_r_toeFrontIndex3_joint', 'def_r_toeFrontThumb1_joint', 'def_r_toeFrontThumb2_joint', 'def_r_toeFrontThumb3_joint', 'def_r_frontLegUprHalfTwist_joint', 'def_l_chestBreath_joint', 'def_r_chestBreath_joint', 'def_l_toeRearIndex1_joint', 'def_l_toeRearIndex2_joint', 'def_l_toeRearIndex3_joint', 'def_l_rearLegUprHalfTwist_joint', 'def_r_toeRearIndex1_joint', 'def_r_toeRearIndex2_joint', 'def_r_toeRearIndex3_joint', 'def_r_rearLegUprHalfTwist_joint', 'rig_l_frontToe_joint', 'rig_r_frontToe_joint', 'rig_l_rearToe_joint', 'rig_r_rearToe_joint', 'srb']
-	# print(bone_names)
-	# print(len(bone_names), len(data.bones_frames_eulers), len(data.bones_frames_locs))
-	# assert( len(bone_names) == len(data.bones_frames_eulers) == len(data.bones_frames_locs) )
-	action = create_anim(ob, filename)
-	# go over list of euler keys
-
-
-	for i, bone_name in enumerate(bone_names):
-		# print(i, bone_name)
-
-		# bone_keys = data.eulers_dict[bone_name]
-		# bone_name = bone_name.decode()
-		# get pose pbone
-		pbone = ob.pose.bones[bone_name]
-		pbone.rotation_mode = "XYZ"
-		# get object mode bone
-		obone = ob.data.bones[bone_name]
-		armature_space_matrix = obone.matrix_local
-		for frame_i in range(data.header.data_0.num_frames):
-			bpy.context.scene.frame_set(frame_i)
-			euler = data.eulers[frame_i, i]
-			loc = data.locs[frame_i, i]
-			# create fcurves
-			data_type = "rotation_euler"
-			# fcu = [action.fcurves.new(data_path = 'pose.bones["'+bone_name+'"].'+data_type, index = i, action_group = bone_name) for i in (0,1,2)]
-
-			# for fcurve, k in zip(fcu, key):
-				# fcurve.keyframe_points.insert(frame_i, math.radians(k))#.interpolation = "Linear"
-			euler = mathutils.Euler( [math.radians(k) for k in euler] )
-			# experiments
-			# trans = (global_corr_mat @ mathutils.Vector(loc)) + armature_space_matrix.translation
-
-			# mdl2 vectors: (-x,-z,y)
-			# loc = mathutils.Vector((-loc[0], -loc[2], loc[1]))
-			loc = mathutils.Vector(loc)
-			# trans = (mathutils.Vector(loc)) + armature_space_matrix.translation
-
-			# the eulers are applied globally to the bone, equivalent to the user doing R+X, R+Y, R+Z for each axis.
-			# this expresses the rotation that should be done in blender coordinates about the center of the bone
-			space_corrected_rot = global_corr_mat @ euler.to_matrix().to_4x4()
-
-			# rot_mat is the final armature space matrix of the posed bone
-			rot_mat = space_corrected_rot @ armature_space_matrix
-
-			# rot_mat.translation = (space_corrected_rot @ loc) + armature_space_matrix.translation
-			# loc_key = (space_corrected_rot @ mathutils.Vector(loc))
-			loc_key = ( euler.to_matrix().to_4x4()  @loc )
-			# loc_key = ( loc @ space_corrected_rot)
-			# loc_key = mathutils.Vector((-loc_key[0], -loc_key[2], loc_key[1]))
-			# rot_mat.translation = loc_key + armature_space_matrix.translation
-			# the ideal translation as calculated by blender
-			rot_mat.translation = pbone.matrix.translation
-			# print(rot_mat)
-			pbone.matrix = rot_mat
-
-			pbone.keyframe_insert(data_path="rotation_euler", frame=frame_i, group=bone_name)
-			pbone.keyframe_insert(data_path="location", frame=frame_i, group=bone_name)
-	return {'FINISHED'}
+import os
+import time
+import math
+
+import bpy
+import mathutils
+import numpy as np
+
+from .utils import matrix_util, format_cache, skeleton, log
+from .cobra_core import pose, keys
+from .pyffi_ext.formats.bani import BaniFormat
+
+logger = log.get_logger("bani")
+# enum value of linear interpolation, for setting it on all keys of a curve at once
+LINEAR = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items["LINEAR"].value
+
+
+def read_bani(file_path):
+	data = BaniFormat.Data()
+	# open file for binary reading
+	with open(file_path, "rb") as stream:
+		data.inspect_quick(stream)
+		data.read(stream, data, file=file_path)
+	return data
+
+
+def load_bani(file_path):
+	"""Loads a bani from the given file path, or reuses it from the cache if it has not changed"""
+	logger.info("Importing {0}".format(file_path))
+	return format_cache.cache.get(file_path, read_bani, variant="bani")
+	
+def get_armature():
+	src_armatures = [ob for ob in bpy.data.objects if type(ob.data) == bpy.types.Armature]
+	#do we have armatures?
+	if src_armatures:
+		#see if one of these is selected -> get only that one
+		if len(src_armatures) > 1:
+			sel_armatures = [ob for ob in src_armatures if ob.select_get()]
+			if sel_armatures:
+				return sel_armatures[0]
+		return src_armatures[0]
+	
+def create_anim(ob, anim_name):
+	action = bpy.data.actions.new(name = anim_name)
+	action.use_fake_user = True
+	ob.animation_data_create()
+	ob.animation_data.action = action
+	return action
+
+def ovl_bones(b_armature_data):
+	# first just get the roots, then extend it
+	roots = [bone for bone in b_armature_data.bones if not bone.parent]
+	# this_level = []
+	out_bones = roots
+	# next_level = []
+	for bone in roots:
+		out_bones += [child for child in bone.children]
+	bone_names = [b.name for b in out_bones]
+	if "srb" in bone_names:
+		bone_names.remove("srb")
+		bone_names.append("srb")
+	return bone_names
+	
+def add_keys(action, bone_name, data_path, values, tolerance=0.0):
+	"""Creates the fcurves of a pose bone channel and keys all frames, values are shaped (frames, channels).
+	With a tolerance, keys that linear interpolation can recreate are left out. Returns the number of keys."""
+	num_keys = 0
+	for index in range(values.shape[1]):
+		channel = values[:, index]
+		frames = keys.reduce_channel(channel, tolerance) if tolerance > 0.0 else np.arange(len(channel))
+		fcu = action.fcurves.new(data_path=f'pose.bones["{bone_name}"].{data_path}', index=index, action_group=bone_name)
+		fcu.keyframe_points.add(len(frames))
+		co = np.stack((frames, channel[frames]), axis=-1).astype(np.float32)
+		fcu.keyframe_points.foreach_set("co", co.ravel())
+		if tolerance > 0.0:
+			fcu.keyframe_points.foreach_set("interpolation", np.full(len(frames), LINEAR, dtype=np.int32))
+		fcu.update()
+		num_keys += len(frames)
+	return num_keys
+
+
+def get_rig(ob):
+	"""Returns the bone names in bani channel order, their armature space rest matrices and parent indices"""
+	skel = skeleton.get_skeleton(ob)
+	# bone_names = ovl_bones(ob.data)
+	# goliath imports fine with the correct name order
+	# bone_names = ['def_c_root_joint', 'def_c_hips_joint', 'def_c_spine1_joint', 'def_c_spine2_joint', 'def_c_chestBreath_joint', 'def_c_spine3_joint', 'def_c_chest_joint', 'def_c_neck1_joint', 'def_c_head_joint', 'def_c_jaw_joint', 'def_l_clavicle_joint', 'def_l_frontLegUpr_joint', 'def_l_frontLegLwr_joint', 'def_l_frontFoot_joint', 'def_l_toeFrontIndex1_joint', 'def_l_toeFrontIndex2_joint', 'def_l_toeFrontPinky1_joint', 'def_l_toeFrontPinky2_joint', 'def_l_toeFrontPinky3_joint', 'def_l_toeFrontRing1_joint', 'def_l_toeFrontRing2_joint', 'def_l_toeFrontRing3_joint', 'def_l_frontLegLwrAllTwist_joint', 'def_l_frontLegLwrHalfTwist_joint', 'def_l_frontLegUprAllTwist_joint', 'def_r_clavicle_joint', 'def_r_frontLegUpr_joint', 'def_r_frontLegLwr_joint', 'def_r_frontFoot_joint', 'def_r_toeFrontIndex1_joint', 'def_r_toeFrontIndex2_joint', 'def_r_toeFrontPinky1_joint', 'def_r_toeFrontPinky2_joint', 'def_r_toeFrontPinky3_joint', 'def_r_toeFrontRing1_joint', 'def_r_toeFrontRing2_joint', 'def_r_toeFrontRing3_joint', 'def_r_frontLegLwrAllTwist_joint', 'def_r_frontLegLwrHalfTwist_joint', 'def_r_frontLegUprAllTwist_joint', 'def_l_rearLegUpr_joint', 'def_l_rearLegLwr_joint', 'def_l_rearHorselink_joint', 'def_l_rearFoot_joint', 'def_l_toeRearMid1_joint', 'def_l_toeRearMid2_joint', 'def_l_toeRearMid3_joint', 'def_l_toeRearPinky1_joint', 'def_l_toeRearPinky2_joint', 'def_l_toeRearPinky3_joint', 'def_l_toeRearRing1_joint', 'def_l_toeRearRing2_joint', 'def_l_toeRearRing3_joint', 'def_l_toeRearThumb1_joint', 'def_l_toeRearThumb2_joint', 'def_l_toeRearThumb3_joint', 'def_l_rearLegLwrAllTwist_joint', 'def_l_rearLegLwrHalfTwist_joint', 'def_l_rearLegUprAllTwist_joint', 'def_r_rearLegUpr_joint', 'def_r_rearLegLwr_joint', 'def_r_rearHorselink_joint', 'def_r_rearFoot_joint', 'def_r_toeRearMid1_joint', 'def_r_toeRearMid2_joint', 'def_r_toeRearMid3_joint', 'def_r_toeRearPinky1_joint', 'def_r_toeRearPinky2_joint', 'def_r_toeRearPinky3_joint', 'def_r_toeRearRing1_joint', 'def_r_toeRearRing2_joint', 'def_r_toeRearRing3_joint', 'def_r_toeRearThumb1_joint', 'def_r_toeRearThumb2_joint', 'def_r_toeRearThumb3_joint', 'def_r_rearLegLwrAllTwist_joint', 'def_r_rearLegLwrHalfTwist_joint', 'def_r_rearLegUprAllTwist_joint', 'def_c_throat_joint', 'def_l_eyelidUpr_joint', 'def_r_eyelidUpr_joint', 'def_l_toeFrontIndex3_joint', 'def_l_toeFrontThumb1_joint', 'def_l_toeFrontThumb2_joint', 'def_l_toeFrontThumb3_joint', 'def_l_frontLegUprHalfTwist_joint', 'def_r_toeFrontIndex3_joint', 'def_r_toeFrontThumb1_joint', 'def_r_toeFrontThumb2_joint', 'def_r_toeFrontThumb3_joint', 'def_r_frontLegUprHalfTwist_joint', 'def_l_chestBreath_joint', 'def_r_chestBreath_joint', 'def_l_toeRearIndex1_joint', 'def_l_toeRearIndex2_joint', 'def_l_toeRearIndex3_joint', 'def_l_rearLegUprHalfTwist_joint', 'def_r_toeRearIndex1_joint', 'def_r_toeRearIndex2_joint', 'def_r_toeRearIndex3_joint', 'def_r_rearLegUprHalfTwist_joint', 'rig_l_frontToe_joint', 'rig_r_frontToe_joint', 'rig_l_rearToe_joint', 'rig_r_rearToe_joint', 'srb']
+	# print(bone_names)
+	# print(len(bone_names), len(data.bones_frames_eulers), len(data.bones_frames_locs))
+	# assert( len(bone_names) == len(data.bones_frames_eulers) == len(data.bones_frames_locs) )
+	return skel.names, skel.blender_matrices, skel.parents
+
+
+def import_clip(ob, rig, data, anim_name, key_tolerance=0.0, timer=None):
+	"""Creates an action for the bani data on the armature.
+	Returns its frame count and the number of keys that were created."""
+	bone_names, rest_matrices, parent_indices = rig
+	# data 0 has various scales and counts
+	anim_length = data.header.data_0.animation_length
+	num_frames = data.header.data_0.num_frames
+	fps = int(round(num_frames/anim_length))
+	logger.debug(f"Banis fps {fps}")
+
+	global_corr_euler = mathutils.Euler( [math.radians(k) for k in (0,-90,-90)] )
+	global_corr_mat = global_corr_euler.to_matrix().to_4x4()
+
+	timer = timer or log.StageTimer()
+	action = create_anim(ob, anim_name)
+	with timer.stage("solve"):
+		# the bones keep their current location, the posed heads are solely defined by the parent chain
+		current_locations = np.array([ob.pose.bones[bone_name].location for bone_name in bone_names], dtype=np.float64)
+		# pose all bones for all frames at once
+		eulers = np.radians(np.asarray(data.eulers, dtype=np.float64)[:num_frames])
+		rotations, locations = pose.solve_pose(
+			rest_matrices, parent_indices, eulers, np.array(global_corr_mat.to_3x3()),
+			np.broadcast_to(current_locations, eulers.shape))
+	num_keys = 0
+	with timer.stage("keys"):
+		for i, bone_name in enumerate(bone_names):
+			pbone = ob.pose.bones[bone_name]
+			pbone.rotation_mode = "XYZ"
+			num_keys += add_keys(action, bone_name, "rotation_euler", rotations[:, i], key_tolerance)
+			num_keys += add_keys(action, bone_name, "location", locations[:, i], key_tolerance)
+	return num_frames, num_keys
+
+
+def get_bani_paths(files, filepath, directory, import_folder):
+	"""Returns the paths of all selected banis, or of all banis in their folder"""
+	directory = directory or os.path.dirname(filepath)
+	if import_folder:
+		return sorted(os.path.join(directory, file) for file in os.listdir(directory) if file.lower().endswith(".bani"))
+	paths = [os.path.join(directory, file.name) for file in files if file.name]
+	return paths if paths else [filepath]
+
+
+def load(operator, context, files = [], filepath = "", directory = "", import_folder = False, key_tolerance = 0.0, set_fps=False, timer=None):
+	starttime = time.time()
+	# sums up the time of each stage over all clips
+	timer = timer or log.StageTimer()
+	ob = get_armature()
+	# the bone order and rest pose are the same for all clips
+	with timer.stage("armature"):
+		rig = get_rig(ob)
+	paths = get_bani_paths(files, filepath, directory, import_folder)
+	max_frames = 0
+	total_keys = 0
+	baked_keys = 0
+	for bani_path in paths:
+		clip_start = time.time()
+		with timer.stage("parse"):
+			data = load_bani(bani_path)
+		num_frames, num_keys = import_clip(ob, rig, data, os.path.basename(bani_path), key_tolerance, timer)
+		max_frames = max(max_frames, num_frames)
+		total_keys += num_keys
+		# a key for every frame on 3 rotation and 3 location channels
+		baked_keys += num_frames * len(rig[0]) * 6
+		logger.info(f"Imported {os.path.basename(bani_path)} with {len(rig[0])} bones and {num_frames} frames in {time.time()-clip_start:.2f} seconds")
+	bpy.context.scene.frame_start = 0
+	bpy.context.scene.frame_end = max_frames-1
+	timer.log(logger, f"Bani import stages of {len(paths)} clips")
+	logger.info(f"Imported {len(paths)} banis in {time.time()-starttime:.2f} seconds")
+	if key_tolerance > 0.0:
+		message = f"Created {total_keys} keys, saved {baked_keys-total_keys} of {baked_keys} baked keys"
+		logger.info(message)
+		if operator:
+			operator.report({"INFO"}, message)
+	return {'FINISHED'}
@@ -0,0 +1,23 @@
+"""Vertex splitting of MDL2 models in a separate python process, run by export_mdl2 with:
+python split_worker.py
+Reads a pickled list of the arrays of each model from stdin and writes the pickled list of their results to stdout.
+Only cobra_core is imported from the add-on folder, so this runs without bpy."""
+import os
+import sys
+import pickle
+
+
+def main():
+	# run as a script, so the add-on folder is only on the path of this process
+	addon_dir = os.path.dirname(os.path.abspath(__file__))
+	if addon_dir not in sys.path:
+		sys.path.insert(0, addon_dir)
+	from cobra_core import split
+	all_arrays = pickle.load(sys.stdin.buffer)
+	results = [split.split_model(arrays) for arrays in all_arrays]
+	pickle.dump(results, sys.stdout.buffer, protocol=pickle.HIGHEST_PROTOCOL)
+	sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+	main()
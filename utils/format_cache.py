@@ -0,0 +1,89 @@
+import os
+from collections import OrderedDict
+
+# upper bound for the summed size of all cached files on disk, the parsed data takes up a similar amount of memory
+MAX_BYTES = 512 * 1024 * 1024
+
+
+def get_stamps(paths):
+	"""Returns the path, size and mtime of each file, files that are missing get no size and mtime"""
+	stamps = []
+	for path in paths:
+		try:
+			stat = os.stat(path)
+			stamps.append((path, stat.st_size, stat.st_mtime_ns))
+		except FileNotFoundError:
+			stamps.append((path, 0, None))
+	return tuple(stamps)
+
+
+def read_data(file_path, data_class):
+	"""Parses a file with the given pyffi Data class"""
+	data = data_class()
+	with open(file_path, "rb") as stream:
+		data.read(stream)
+	return data
+
+
+class FormatCache:
+	"""LRU cache for parsed files.
+	Entries are keyed by path and variant and are only valid while the size and mtime of the file,
+	and of any companion files that were read along with it, are unchanged."""
+
+	def __init__(self, max_bytes=MAX_BYTES):
+		self.max_bytes = max_bytes
+		# (path, variant) -> (data, ((path, size, mtime), ...), size)
+		self.entries = OrderedDict()
+		self.total_bytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, file_path, loader, variant="", companions=None):
+		"""Returns the parsed data for file_path, calling loader(file_path) if it is not cached yet.
+		companions(data) returns the paths of any other files the loader read, eg. the ms2 of a mdl2.
+		The cached data is shared, callers that modify it have to read the file themselves."""
+		path = os.path.normcase(os.path.abspath(file_path))
+		key = (path, variant)
+		entry = self.entries.get(key)
+		if entry and get_stamps(p for p, size, mtime in entry[1]) == entry[1]:
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return entry[0]
+		self.misses += 1
+		if entry:
+			self.remove(key)
+		# stat before reading, so a file that changes while it is read is parsed again next time
+		stamps = get_stamps((path, ))
+		data = loader(file_path)
+		if companions:
+			stamps += get_stamps(os.path.normcase(os.path.abspath(p)) for p in companions(data))
+		size = sum(size for p, size, mtime in stamps)
+		if size <= self.max_bytes:
+			self.entries[key] = (data, stamps, size)
+			self.total_bytes += size
+			# drop the least recently used files
+			while self.total_bytes > self.max_bytes:
+				self.remove(next(iter(self.entries)))
+		return data
+
+	def remove(self, key):
+		data, stamp, size = self.entries.pop(key)
+		self.total_bytes -= size
+
+	def clear(self):
+		self.entries.clear()
+		self.total_bytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	def stats(self):
+		return f"{len(self.entries)} files ({self.total_bytes / 1048576:.1f} MB), {self.hits} hits, {self.misses} misses"
+
+
+# shared by all importers and exporters for the whole blender session
+cache = FormatCache()
+
+
+def get_data(file_path, data_class):
+	"""Returns the parsed file, only parsing it if it changed since it was last read"""
+	return cache.get(file_path, lambda p: read_data(p, data_class), variant=f"{data_class.__module__}.{data_class.__qualname__}")
@@ -0,0 +1,61 @@
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+# parent of the loggers of all pipelines, eg. cobra.import or cobra.shell
+ROOT_NAME = "cobra"
+
+
+def get_logger(name):
+	"""Returns the logger of a pipeline: import, export, bani, matcol or shell"""
+	return logging.getLogger(f"{ROOT_NAME}.{name}")
+
+
+def setup(level="INFO"):
+	"""Sends the messages of all cobra loggers to blender's console, only once per session"""
+	root = logging.getLogger(ROOT_NAME)
+	if not root.handlers:
+		handler = logging.StreamHandler(sys.stdout)
+		handler.setFormatter(logging.Formatter("%(name)s %(levelname)s: %(message)s"))
+		root.addHandler(handler)
+		# blender's own loggers should not print our messages a second time
+		root.propagate = False
+	set_level(level)
+
+
+def set_level(level):
+	logging.getLogger(ROOT_NAME).setLevel(level)
+
+
+class StageTimer:
+	"""Sums up the wall time and number of calls of each stage of an operator"""
+
+	def __init__(self):
+		# stage name -> [seconds, calls], in order of first use
+		self.stages = {}
+
+	@contextmanager
+	def stage(self, name):
+		start_time = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add(name, time.perf_counter() - start_time)
+
+	def add(self, name, seconds, calls=1):
+		entry = self.stages.setdefault(name, [0.0, 0])
+		entry[0] += seconds
+		entry[1] += calls
+
+	def summary(self):
+		"""Returns a table of all stages, slowest first"""
+		width = max((len(name) for name in self.stages), default=5)
+		lines = [f"{'stage':<{width}}  {'seconds':>8}  {'calls':>6}"]
+		for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0]):
+			lines.append(f"{name:<{width}}  {seconds:>8.3f}  {calls:>6}")
+		return "\n".join(lines)
+
+	def log(self, logger, title):
+		if self.stages:
+			logger.info(f"{title}\n{self.summary()}")
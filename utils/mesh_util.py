@@ -0,0 +1,84 @@
+import time
+import math
+import bmesh
+
+from . import log
+
+logger = log.get_logger("import")
+# uv coordinates closer than this are considered connected, the same limit blender uses for uv islands
+UV_LIMIT = 0.0001
+
+
+def uv_edge_key(loop, uv_lay):
+	"""Returns the uv coordinates of both verts of a loop's edge, as seen from the loop's face"""
+	next_loop = loop.link_loop_next
+	return {loop.vert.index: tuple(loop[uv_lay].uv), next_loop.vert.index: tuple(next_loop[uv_lay].uv)}
+
+
+def uvs_match(uvs, other_uvs, limit):
+	"""Returns True if both edge keys have the same uv coordinates for each vert, within limit"""
+	for vert_index, uv in uvs.items():
+		other_uv = other_uvs[vert_index]
+		if abs(uv[0] - other_uv[0]) > limit or abs(uv[1] - other_uv[1]) > limit:
+			return False
+	return True
+
+
+def seams_from_islands(bm, uv_lay, limit=UV_LIMIT):
+	"""Marks all edges whose faces do not share uv coordinates as seams, like bpy.ops.uv.seams_from_islands().
+	Coordinates that differ by no more than limit are shared, so float noise from the cleanup does not split islands."""
+	for edge in bm.edges:
+		loops = edge.link_loops
+		# boundary and wire edges are never split
+		if len(loops) < 2:
+			continue
+		uvs = uv_edge_key(loops[0], uv_lay)
+		for other_loop in loops[1:]:
+			if not uvs_match(uvs, uv_edge_key(other_loop, uv_lay), limit):
+				edge.seam = True
+				break
+
+
+def clean_mesh(me, bisect=False, tris_to_quads=True, remove_doubles=True, merge_distance=0.000001, uv_seams=True):
+	"""Runs the import cleanup steps on the mesh data directly, without entering edit mode.
+	Returns a dict of the seconds spent on each step."""
+	timings = {}
+	start_time = time.time()
+	bm = bmesh.new()
+	bm.from_mesh(me)
+	timings["from_mesh"] = time.time() - start_time
+
+	if bisect:
+		start_time = time.time()
+		# cut along the YZ plane and remove everything on the negative X side
+		geom = bm.verts[:] + bm.edges[:] + bm.faces[:]
+		bmesh.ops.bisect_plane(bm, geom=geom, plane_co=(0, 0, 0), plane_no=(1, 0, 0), clear_inner=True)
+		timings["bisect"] = time.time() - start_time
+
+	if tris_to_quads:
+		start_time = time.time()
+		# same defaults as bpy.ops.mesh.tris_convert_to_quads()
+		bmesh.ops.join_triangles(
+			bm, faces=bm.faces[:], angle_face_threshold=math.radians(40), angle_shape_threshold=math.radians(40))
+		timings["tris_to_quads"] = time.time() - start_time
+
+	if remove_doubles:
+		start_time = time.time()
+		bmesh.ops.remove_doubles(bm, verts=bm.verts[:], dist=merge_distance)
+		timings["remove_doubles"] = time.time() - start_time
+
+	if uv_seams:
+		start_time = time.time()
+		uv_lay = bm.loops.layers.uv.active
+		if uv_lay:
+			seams_from_islands(bm, uv_lay)
+		else:
+			logger.warning(me.name+" has no UV coordinates!")
+		timings["uv_seams"] = time.time() - start_time
+
+	start_time = time.time()
+	bm.to_mesh(me)
+	bm.free()
+	me.update()
+	timings["to_mesh"] = time.time() - start_time
+	return timings
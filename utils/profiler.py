@@ -0,0 +1,69 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+
+from . import log
+
+logger = log.get_logger("profile")
+
+
+class Profiler:
+	"""Collects the stage times of one operator run, and optionally a cProfile of all its function calls"""
+
+	def __init__(self, name, use_cprofile=False):
+		self.name = name
+		self.timer = log.StageTimer()
+		self.profile = cProfile.Profile() if use_cprofile else None
+		self.seconds = 0.0
+
+	def run(self, func, *args, **kwargs):
+		"""Calls func with the stage timer of this profiler and returns its result"""
+		start_time = time.perf_counter()
+		if self.profile:
+			self.profile.enable()
+		try:
+			return func(*args, timer=self.timer, **kwargs)
+		finally:
+			if self.profile:
+				self.profile.disable()
+			self.seconds = time.perf_counter() - start_time
+
+	def top_functions(self, top=20):
+		"""Returns the top functions of the cProfile, by cumulative time"""
+		if not self.profile:
+			return []
+		stats = pstats.Stats(self.profile).stats
+		rows = sorted(stats.items(), key=lambda item: -item[1][3])[:top]
+		return [
+			{"function": f"{file}:{line}({func})", "calls": calls, "primitive_calls": primitive_calls,
+			 "tottime": tottime, "cumtime": cumtime}
+			for (file, line, func), (primitive_calls, calls, tottime, cumtime, callers) in rows]
+
+	def report(self, source_path="", top=20):
+		return {
+			"operator": self.name,
+			"file": source_path,
+			"seconds": self.seconds,
+			"stages": dict(
+				(name, {"seconds": seconds, "calls": calls}) for name, (seconds, calls) in self.timer.stages.items()),
+			"top_functions": self.top_functions(top),
+		}
+
+	def write(self, source_path, top=20):
+		"""Writes the json report and a readable top N report next to source_path and returns their paths"""
+		base_path = f"{source_path}.{self.name.replace('.', '_')}.profile"
+		json_path = base_path + ".json"
+		with open(json_path, "w") as f:
+			json.dump(self.report(source_path, top), f, indent="\t")
+		text_path = base_path + ".txt"
+		with open(text_path, "w") as f:
+			f.write(f"{self.name} on {source_path} took {self.seconds:.3f} seconds\n\n")
+			f.write(self.timer.summary() + "\n")
+			if self.profile:
+				stream = io.StringIO()
+				pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(top)
+				f.write("\n" + stream.getvalue())
+		logger.info(f"Wrote profile of {self.name} to {json_path}")
+		return json_path, text_path
@@ -0,0 +1,67 @@
+import numpy as np
+
+from . import matrix_util
+from ..cobra_core import armature
+
+
+class Skeleton:
+	"""Bone hierarchy and rest pose of an armature, with the bones in mdl2 order"""
+
+	def __init__(self, b_armature_obj):
+		bones = b_armature_obj.data.bones
+		pose_bones = b_armature_obj.pose.bones
+		# the mdl2 order is stored on the pose bones on import, bones that were added later go last
+		order = sorted(range(len(pose_bones)), key=lambda i: (pose_bones[i].get("index", len(pose_bones)), i))
+		self.names = [pose_bones[i].name for i in order]
+		# bone name -> index in mdl2 order
+		self.index = dict((name, i) for i, name in enumerate(self.names))
+		# index of each bone's parent, -1 for roots
+		self.parents = [self.index[bones[name].parent.name] if bones[name].parent else -1 for name in self.names]
+		# armature space rest matrices in blender space, ie. bone.matrix_local
+		self.blender_matrices = np.array([bones[name].matrix_local for name in self.names], dtype=np.float64).reshape(-1, 4, 4)
+		# armature space rest matrices in ms2 space
+		self.ms2_matrices = armature.blender_bind_to_nif_bind(self.blender_matrices, np.array(matrix_util.correction))
+		# rest matrices relative to the parent, in blender space
+		self.local_matrices = armature.to_local_space(self.blender_matrices, self.parents)
+
+
+def get_stamp(b_armature_obj):
+	"""Returns a description of the armature that changes whenever its bones are edited.
+	The rest pose of all bones is read in one go, the roll of a bone is part of its matrix_local."""
+	bones = b_armature_obj.data.bones
+	# head_local, tail_local and matrix_local of each bone
+	rest = np.empty((3 + 3 + 16, len(bones)), dtype=np.float32)
+	bones.foreach_get("head_local", rest[:3].reshape(-1))
+	bones.foreach_get("tail_local", rest[3:6].reshape(-1))
+	bones.foreach_get("matrix_local", rest[6:].reshape(-1))
+	return (
+		tuple(bones.keys()),
+		tuple(bone.parent.name if bone.parent else "" for bone in bones),
+		tuple(pbone.get("index", -1) for pbone in b_armature_obj.pose.bones),
+		hash(rest.tobytes()))
+
+
+# (armature object, armature datablock) pointers -> (stamp, Skeleton)
+skeletons = {}
+
+
+def get_key(b_armature_obj):
+	"""Returns the key of an armature in the cache, which survives renaming it"""
+	return b_armature_obj.as_pointer(), b_armature_obj.data.as_pointer()
+
+
+def get_skeleton(b_armature_obj):
+	"""Returns the skeleton of an armature object, it is only rebuilt when the armature changed.
+	The armature must not be in edit mode, as the bones are only updated when leaving it."""
+	stamp = get_stamp(b_armature_obj)
+	key = get_key(b_armature_obj)
+	entry = skeletons.get(key)
+	if entry and entry[0] == stamp:
+		return entry[1]
+	skeleton = Skeleton(b_armature_obj)
+	skeletons[key] = (stamp, skeleton)
+	return skeleton
+
+
+def clear():
+	skeletons.clear()
@@ -0,0 +1,53 @@
+import os
+
+
+class TextureIndex:
+	"""Lookup for the png files of a folder, by lowercase material name and texture slot.
+	Pngs are expected to be named material.slot.png, eg. 'ankylo.pbasepackedtexture_01.png'"""
+
+	def __init__(self, folder):
+		self.folder = folder
+		# png file names in listdir order
+		self.files = []
+		# material -> [(slot, file name), ...]
+		self.by_material = {}
+		# slot -> [(listdir position, file name), ...]
+		self.by_slot = {}
+		for file in os.listdir(folder):
+			lower = file.lower()
+			if not lower.endswith(".png"):
+				continue
+			material, _, slot = lower[:-4].rpartition(".")
+			self.by_material.setdefault(material, []).append((slot, file))
+			self.by_slot.setdefault(slot, []).append((len(self.files), file))
+			self.files.append(file)
+
+	def find(self, material, slot_prefix):
+		"""Returns the pngs of material whose slot starts with slot_prefix"""
+		slot_prefix = slot_prefix.lower()
+		return [file for slot, file in self.by_material.get(material.lower(), ()) if slot.startswith(slot_prefix)]
+
+	def find_slot(self, slot_prefix):
+		"""Returns the pngs of all materials whose slot starts with slot_prefix, in listdir order"""
+		slot_prefix = slot_prefix.lower()
+		found = [item for slot, items in self.by_slot.items() if slot.startswith(slot_prefix) for item in items]
+		return [file for i, file in sorted(found)]
+
+
+# folder -> (folder mtime, TextureIndex)
+indices = {}
+
+
+def get_index(folder):
+	"""Returns the texture index of folder, it is only rebuilt when files were added or removed"""
+	folder = os.path.normcase(os.path.abspath(folder))
+	mtime = os.stat(folder).st_mtime_ns
+	if folder in indices and indices[folder][0] == mtime:
+		return indices[folder][1]
+	index = TextureIndex(folder)
+	indices[folder] = (mtime, index)
+	return index
+
+
+def clear():
+	indices.clear()